@@ -4,28 +4,54 @@ YouTube Downloader API
 Servidor FastAPI para descargar videos de YouTube
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
 import yt_dlp
+import aiofiles
+import aiofiles.os
 import os
-import uuid
+import secrets
 import asyncio
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Set, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import json
+import queue
+import re
+import importlib.util
+import mimetypes
 import time
+import threading
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import random
-import string
+from urllib.parse import quote
 
 COOKIES_DIR = Path("cookies")
 COOKIES_DIR.mkdir(exist_ok=True)
 COOKIES_FILE = COOKIES_DIR / "cookies.txt"
 
+# Generación de las cookies: avanza cada vez que la app crea, refresca o borra el
+# archivo. Las descargas también lo reescriben al terminar, así que el mtime no sirve.
+_cookies_generations = itertools.count(1)
+_cookies_generation = 0
+
+def bump_cookies_generation():
+    """Marca las cookies como cambiadas (invalida las instancias de YoutubeDL del pool)"""
+    global _cookies_generation
+    _cookies_generation = next(_cookies_generations)
+
+# Caché compartido de yt-dlp (JS del reproductor, firmas) entre todas las peticiones
+YTDLP_CACHE_DIR = Path(".yt-dlp-cache").absolute()
+
 BROWSER_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -34,6 +60,19 @@ BROWSER_HEADERS = {
     'Connection': 'keep-alive',
     'Upgrade-Insecure-Requests': '1',
 }
+# YouTube sirve Brotli por defecto; solo anunciarlo si urllib3 puede decodificarlo
+if importlib.util.find_spec("brotli") or importlib.util.find_spec("brotlicffi"):
+    BROWSER_HEADERS['Accept-Encoding'] = 'gzip, deflate, br'
+
+# Sesión HTTP compartida: reutiliza conexiones keep-alive (sin repetir el handshake TLS)
+_yt_session = requests.Session()
+_yt_session.headers.update(BROWSER_HEADERS)
+_yt_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
+_yt_session_lock = threading.Lock()
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -42,7 +81,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="YouTube Downloader API",
     description="API para descargar videos de YouTube con opciones avanzadas",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware - Permitir todas las origins para demo
@@ -58,6 +98,147 @@ app.add_middleware(
 DOWNLOAD_DIR = Path("downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
+# Detrás de nginx, delegar el envío de archivos con X-Accel-Redirect (sendfile)
+USE_X_ACCEL = os.environ.get("USE_X_ACCEL")
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "/_internal_downloads/")
+
+FILE_CHUNK_SIZE = 1024 * 1024
+
+class LargeFileResponse(FileResponse):
+    """FileResponse con bloques de 1 MiB para archivos de video grandes"""
+    chunk_size = FILE_CHUNK_SIZE
+
+async def _file_iter(path, start=0, length=None, chunk=FILE_CHUNK_SIZE):
+    """Lee un archivo por bloques sin bloquear el event loop"""
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            data = await f.read(chunk if remaining is None else min(chunk, remaining))
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+def parse_byte_range(range_header, size):
+    """Interpreta una cabecera Range de un solo rango; devuelve (inicio, fin) inclusivos"""
+    unit, _, spec = range_header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        raise HTTPException(status_code=416, detail="Rango no soportado")
+
+    start_str, _, end_str = spec.strip().partition('-')
+    try:
+        if start_str:
+            start = int(start_str)
+            end = min(int(end_str), size - 1) if end_str else size - 1
+        else:
+            # bytes=-N: los últimos N bytes
+            start = max(size - int(end_str), 0)
+            end = size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Rango inválido")
+
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Rango fuera del archivo")
+    return start, end
+
+# Almacén de progreso de descargas (acotado, se descartan primero las más antiguas)
+MAX_TRACKED_DOWNLOADS = 10000
+PROGRESS_TTL = 3600  # 1 hora
+download_progress: "OrderedDict[str, Dict]" = OrderedDict()
+# Los hooks de yt-dlp escriben desde hilos de descarga; los endpoints leen copias
+progress_lock = threading.Lock()
+
+# Con REDIS_URL el progreso se guarda en Redis (un hash por descarga) y se comparte
+# entre workers de Uvicorn. Los hilos de descarga usan el cliente síncrono y los
+# endpoints el asíncrono, para no bloquear el event loop. progress_lock solo
+# protege el almacén en memoria: nunca se retiene durante una llamada a Redis.
+REDIS_URL = os.environ.get("REDIS_URL")
+REDIS_PROGRESS_TTL = 86400  # 24 horas
+_redis = None
+_aredis = None
+if REDIS_URL:
+    import redis
+    import redis.asyncio
+    _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=2, decode_responses=True)
+    _aredis = redis.asyncio.Redis.from_url(REDIS_URL, socket_timeout=2, decode_responses=True)
+
+def _progress_key(download_id):
+    return f"dl:{download_id}"
+
+def _encode_fields(fields):
+    """Cada campo del hash se guarda como JSON para conservar tipos y valores None"""
+    return {name: json.dumps(value) for name, value in fields.items()}
+
+def _decode_fields(raw):
+    return {name: json.loads(value) for name, value in raw.items()} if raw else None
+
+async def track_download(download_id, progress):
+    """Registra una descarga, expulsando las más antiguas si se supera el límite"""
+    if _aredis is not None:
+        key = _progress_key(download_id)
+        async with _aredis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=_encode_fields(progress))
+            pipe.expire(key, REDIS_PROGRESS_TTL)
+            await pipe.execute()
+        return
+
+    with progress_lock:
+        while len(download_progress) >= MAX_TRACKED_DOWNLOADS:
+            download_progress.popitem(last=False)
+        download_progress[download_id] = progress
+
+def update_progress(download_id, **fields):
+    """Actualiza de forma atómica los campos de progreso de una descarga (desde hilos)"""
+    if _redis is not None:
+        # HSET de los campos cambiados: sin leer-modificar-escribir, no se pierden
+        # actualizaciones concurrentes
+        key = _progress_key(download_id)
+        with _redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=_encode_fields(fields))
+            pipe.expire(key, REDIS_PROGRESS_TTL)
+            pipe.execute()
+        return True
+
+    with progress_lock:
+        progress = download_progress.get(download_id)
+        if progress is None:
+            return False
+        progress.update(fields)
+        return True
+
+async def get_progress_snapshot(download_id):
+    """Devuelve una copia consistente del progreso de una descarga (o None)"""
+    if _aredis is not None:
+        return _decode_fields(await _aredis.hgetall(_progress_key(download_id)))
+
+    with progress_lock:
+        progress = download_progress.get(download_id)
+        return dict(progress) if progress is not None else None
+
+# Estados de descargas en curso: sus archivos se están escribiendo o esperan la mezcla
+ACTIVE_STATUSES = ('starting', 'downloading', 'processing')
+
+def is_download_active(download_id):
+    """Indica si una descarga sigue en curso (bloqueante con Redis)"""
+    if _redis is not None:
+        status = _redis.hget(_progress_key(download_id), 'status')
+        return status is not None and json.loads(status) in ACTIVE_STATUSES
+
+    with progress_lock:
+        progress = download_progress.get(download_id)
+        return progress is not None and progress.get('status') in ACTIVE_STATUSES
+
+# Fragmentos simultáneos por descarga: no más que CPUs disponibles, máximo 4
+CONCURRENT_FRAGMENTS = min(os.cpu_count() or 1, 4)
+
+# Pool dedicado a descargas para no ocupar el threadpool de las peticiones.
+# Con varios workers, mientras ffmpeg extrae el audio de una descarga (CPU)
+# otra puede seguir bajando datos (red).
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 4))
+DOWNLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="yt-dl")
+
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -71,9 +252,9 @@ def get_random_user_agent():
     
 def generate_session_data():
     """Genera datos de sesión aleatorios pero realistas"""
-    session_id = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
-    visitor_id = ''.join(random.choices(string.ascii_letters + string.digits, k=11))
-    client_id = ''.join(random.choices(string.digits, k=19))
+    session_id = secrets.token_urlsafe(12)[:16]
+    visitor_id = secrets.token_urlsafe(9)[:11]
+    client_id = str(secrets.randbelow(10 ** 19)).zfill(19)
     
     return {
         'session_id': session_id,
@@ -81,25 +262,35 @@ def generate_session_data():
         'client_id': client_id
     }
 
+# Cookies básicas de YouTube (formato Netscape)
+_COOKIE_TEMPLATE = (
+    "# Netscape HTTP Cookie File\n"
+    "# This file contains the HTTP cookies for YouTube\n"
+    "# Generated on {ts}\n"
+    "\n"
+    ".youtube.com\tTRUE\t/\tFALSE\t{year}\tVISITOR_INFO1_LIVE\t{visitor_id}\n"
+    ".youtube.com\tTRUE\t/\tFALSE\t{year}\tYSC\t{session_id}\n"
+    ".youtube.com\tTRUE\t/\tTRUE\t{year}\tCONSENT\tYES+cb.20210328-17-p0.en+FX+{consent}\n"
+    ".youtube.com\tTRUE\t/\tFALSE\t{year}\tGPS\t1\n"
+    ".youtube.com\tTRUE\t/\tFALSE\t{day}\tST-{st}\t{client_id}\n"
+)
+
 def create_youtube_cookies():
     """Crea un archivo de cookies básico para YouTube"""
     try:
-        session_data = generate_session_data()
-        
-        # Cookies básicas de YouTube (formato Netscape)
-        cookies_content = f"""# Netscape HTTP Cookie File
-# This file contains the HTTP cookies for YouTube
-# Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}
-
-.youtube.com	TRUE	/	FALSE	{int(time.time()) + 31536000}	VISITOR_INFO1_LIVE	{session_data['visitor_id']}
-.youtube.com	TRUE	/	FALSE	{int(time.time()) + 31536000}	YSC	{session_data['session_id']}
-.youtube.com	TRUE	/	TRUE	{int(time.time()) + 31536000}	CONSENT	YES+cb.20210328-17-p0.en+FX+{random.randint(100, 999)}
-.youtube.com	TRUE	/	FALSE	{int(time.time()) + 31536000}	GPS	1
-.youtube.com	TRUE	/	FALSE	{int(time.time()) + 86400}	ST-{random.randint(1000000, 9999999)}	{session_data['client_id']}
-"""
+        now = int(time.time())
+        cookies_content = _COOKIE_TEMPLATE.format_map({
+            **generate_session_data(),
+            'ts': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'year': now + 31536000,
+            'day': now + 86400,
+            'consent': random.randint(100, 999),
+            'st': random.randint(1000000, 9999999),
+        })
         
-        with open(COOKIES_FILE, 'w', encoding='utf-8') as f:
+        with open(COOKIES_FILE, 'w', encoding='utf-8', buffering=65536) as f:
             f.write(cookies_content)
+        bump_cookies_generation()
             
         logger.info(f"Cookies creadas en: {COOKIES_FILE}")
         return True
@@ -107,14 +298,21 @@ def create_youtube_cookies():
     except Exception as e:
         logger.error(f"Error creando cookies: {e}")
         return False
+
+# Con INFO_ALL_FORMATS la extracción de /api/video-info incluye los manifiestos
+# DASH/HLS: listar es más lento, pero /api/download puede reutilizar esa info
+# sin volver a extraer. Sin él, la descarga hace su propia extracción completa.
+INFO_ALL_FORMATS = bool(os.environ.get("INFO_ALL_FORMATS"))
+
 def get_enhanced_ydl_opts():
-    """Opciones mejoradas para yt-dlp"""
-    return {
+    """Opciones mejoradas para yt-dlp (solo extracción de info, no descargas)"""
+    opts = {
         'quiet': True,
         'no_warnings': True,
         'skip_download': True,
         'extract_flat': False,
         'cookiefile': str(COOKIES_FILE),
+        'cachedir': str(YTDLP_CACHE_DIR),
         # Headers más realistas
         'http_headers': {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -127,8 +325,7 @@ def get_enhanced_ydl_opts():
         # Configuraciones adicionales
         'extractor_args': {
             'youtube': {
-                'skip': ['hls', 'dash'],  # Evitar formatos problemáticos
-                'player_skip': ['configs'],
+                'player_client': ['web', 'android'],  # Menos clientes, menos peticiones
             }
         },
         # Reintentos y timeouts
@@ -139,51 +336,88 @@ def get_enhanced_ydl_opts():
         'sleep_interval': 1,
         'max_sleep_interval': 5,
     }
+    if not INFO_ALL_FORMATS:
+        # Para listar formatos no hacen falta los manifiestos DASH/HLS
+        opts['youtube_include_dash_manifest'] = False
+        opts['youtube_include_hls_manifest'] = False
+        opts['extractor_args']['youtube'].update({
+            'skip': ['hls', 'dash'],  # Evitar formatos problemáticos
+            'player_skip': ['configs'],
+        })
+    return opts
     
+def netscape_cookie_line(cookie, default_expires):
+    """Convierte una cookie de requests a una línea en formato Netscape"""
+    # Formato: domain, domain_specified, path, secure, expires, name, value
+    domain = cookie.domain if cookie.domain.startswith('.') else f'.{cookie.domain}'
+    domain_specified = "TRUE" if cookie.domain_specified else "FALSE"
+    path = cookie.path or "/"
+    secure = "TRUE" if cookie.secure else "FALSE"
+    expires = int(cookie.expires) if cookie.expires else default_expires
+    return f"{domain}\t{domain_specified}\t{path}\t{secure}\t{expires}\t{cookie.name}\t{cookie.value}"
+
 def refresh_cookies():
     """Actualiza las cookies haciendo una request a YouTube"""
     try:
         # Hacer request a YouTube para obtener cookies frescas
-        session = requests.Session()
-        session.headers.update(BROWSER_HEADERS)
+        with _yt_session_lock:
+            # Empezar sin cookies previas para no acumularlas entre refrescos
+            _yt_session.cookies.clear()
+            # Solo interesan las cabeceras Set-Cookie: no descargar ni descomprimir el HTML
+            # (~1 MB). Cerrar sin leerlo descarta la conexión, pero los refrescos son tan
+            # poco frecuentes que una conexión keep-alive inactiva no llegaría a reutilizarse.
+            with _yt_session.get('https://www.youtube.com', timeout=10, stream=True) as response:
+                status_code = response.status_code
+            session_cookies = list(_yt_session.cookies)
         
-        # Request inicial a la página principal
-        response = session.get('https://www.youtube.com', timeout=10)
-        
-        if response.status_code == 200:
+        if status_code == 200:
             # Convertir cookies de requests a formato Netscape
+            default_expires = int(time.time()) + 31536000
             cookies_lines = [
                 "# Netscape HTTP Cookie File",
                 f"# Generated on {time.strftime('%Y-%m-%d %H:%M:%S')}",
                 ""
             ]
+            cookies_lines.extend(netscape_cookie_line(cookie, default_expires) for cookie in session_cookies)
             
-            for cookie in session.cookies:
-                # Formato: domain, domain_specified, path, secure, expires, name, value
-                domain = cookie.domain if cookie.domain.startswith('.') else f'.{cookie.domain}'
-                domain_specified = "TRUE" if cookie.domain_specified else "FALSE"
-                path = cookie.path or "/"
-                secure = "TRUE" if cookie.secure else "FALSE"
-                expires = str(int(cookie.expires)) if cookie.expires else str(int(time.time()) + 31536000)
-                
-                cookie_line = f"{domain}\t{domain_specified}\t{path}\t{secure}\t{expires}\t{cookie.name}\t{cookie.value}"
-                cookies_lines.append(cookie_line)
-            
-            with open(COOKIES_FILE, 'w', encoding='utf-8') as f:
+            with open(COOKIES_FILE, 'w', encoding='utf-8', buffering=65536) as f:
                 f.write('\n'.join(cookies_lines))
+            bump_cookies_generation()
                 
             logger.info("Cookies actualizadas desde YouTube")
             return True
         else:
-            logger.warning(f"Response code: {response.status_code}")
+            logger.warning(f"Response code: {status_code}")
             return create_youtube_cookies()  # Fallback
             
     except Exception as e:
         logger.error(f"Error actualizando cookies: {e}")
         return create_youtube_cookies()  # Fallback
 
+COOKIE_CHECK_INTERVAL = 60  # segundos
+_last_cookie_check = 0.0
+_cookie_ok = False
+_cookie_check_lock = threading.Lock()
+
 def ensure_cookies_exist():
-    """Asegura que existan cookies válidas"""
+    """Asegura que existan cookies válidas (el resultado se reutiliza durante un minuto)"""
+    global _last_cookie_check, _cookie_ok
+    with _cookie_check_lock:
+        now = time.time()
+        if _cookie_ok and now - _last_cookie_check < COOKIE_CHECK_INTERVAL:
+            return True
+
+        _cookie_ok = _check_cookies()
+        _last_cookie_check = now
+        return _cookie_ok
+
+def invalidate_cookie_check():
+    """Fuerza a que la próxima llamada a ensure_cookies_exist vuelva a comprobar el archivo"""
+    global _cookie_ok
+    with _cookie_check_lock:
+        _cookie_ok = False
+
+def _check_cookies():
     if not COOKIES_FILE.exists():
         logger.info("No hay cookies, creando nuevas...")
         return refresh_cookies()
@@ -230,7 +464,7 @@ async def get_cookies_status():
 async def refresh_cookies_endpoint():
     """Actualiza las cookies manualmente"""
     try:
-        success = refresh_cookies()
+        success = await run_in_threadpool(refresh_cookies)
         if success:
             return {
                 "success": True,
@@ -248,6 +482,8 @@ async def clear_cookies():
     try:
         if COOKIES_FILE.exists():
             COOKIES_FILE.unlink()
+            bump_cookies_generation()
+            invalidate_cookie_check()
             return {"success": True, "message": "Cookies eliminadas"}
         else:
             return {"success": True, "message": "No había cookies que eliminar"}
@@ -264,22 +500,60 @@ def ensure_cookies_on_startup():
         logger.warning("No se pudieron crear cookies, algunos videos podrían fallar")
         
 # Limpiar archivos antiguos al iniciar
-def cleanup_old_files():
-    """Elimina archivos de más de 1 hora"""
+CLEANUP_MIN_INTERVAL = 60  # segundos entre limpiezas
+_last_cleanup = 0.0
+
+def cleanup_old_files(force=False):
+    """Elimina archivos de más de 1 hora (force ignora el intervalo mínimo entre limpiezas)"""
+    global _last_cleanup
     try:
         current_time = time.time()
-        for file_path in DOWNLOAD_DIR.glob("*"):
-            if file_path.is_file():
-                file_age = current_time - file_path.stat().st_mtime
-                if file_age > 3600:  # 1 hora
-                    file_path.unlink()
-                    logger.info(f"Archivo eliminado: {file_path}")
+        if not force and current_time - _last_cleanup < CLEANUP_MIN_INTERVAL:
+            return
+        _last_cleanup = current_time
+
+        # os.scandir reutiliza el tipo de entrada del directorio y cachea el stat
+        with os.scandir(DOWNLOAD_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                file_age = current_time - entry.stat(follow_symlinks=False).st_mtime
+                # Los archivos de una descarga en curso (p. ej. el video ya bajado
+                # mientras llega el audio) se conservan aunque sean antiguos
+                if file_age > 3600 and not is_download_active(entry.name.partition('_')[0]):  # 1 hora
+                    os.unlink(entry.path)
+                    logger.info(f"Archivo eliminado: {entry.path}")
+
+        # Olvidar descargas terminadas hace tiempo
+        with progress_lock:
+            for download_id, progress in list(download_progress.items()):
+                if progress.get('status') in ('completed', 'error') and \
+                        current_time - progress.get('created_at', 0) > PROGRESS_TTL:
+                    del download_progress[download_id]
     except Exception as e:
         logger.error(f"Error limpiando archivos: {e}")
 
-cleanup_old_files()
 ensure_cookies_on_startup() 
 
+CLEANUP_INTERVAL = 600  # 10 minutos
+_cleanup_task: Optional[asyncio.Task] = None
+
+async def _cleanup_loop():
+    """Limpia archivos antiguos periódicamente sin bloquear el event loop"""
+    while True:
+        await run_in_threadpool(cleanup_old_files)
+        await asyncio.sleep(CLEANUP_INTERVAL)
+
+@app.on_event("startup")
+async def _schedule_cleanup():
+    global _cleanup_task
+    _cleanup_task = asyncio.create_task(_cleanup_loop())
+
+@app.on_event("shutdown")
+async def _shutdown_downloads():
+    """Descarta las descargas en cola; las que están en curso terminan en su hilo"""
+    DOWNLOAD_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
 class VideoInfoRequest(BaseModel):
     url: str
 
@@ -290,67 +564,188 @@ class DownloadRequest(BaseModel):
     subtitle_lang: Optional[str] = None
     audio_only: bool = False
 
-# Almacén de progreso de descargas
-download_progress: Dict[str, Dict] = {}
-
-def progress_hook(d):
-    """Hook para capturar progreso de yt-dlp"""
-    try:
-        if d['status'] == 'downloading':
-            # Extraer ID de descarga del filename
-            filename = d.get('filename', '')
-            download_id = None
-
-            # Buscar el download_id en el filename
-            for did in download_progress.keys():
-                if did in filename:
-                    download_id = did
-                    break
-
-            if not download_id:
+# Caché LRU de información de videos: url -> (timestamp, resultado, format_ids)
+INFO_CACHE_TTL = 600  # 10 minutos
+INFO_CACHE_MAX = 2048
+_info_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _get_cached(url, ttl=INFO_CACHE_TTL):
+    """Devuelve la entrada cacheada de una URL si no ha expirado"""
+    entry = _info_cache.get(url)
+    if entry is None:
+        return None
+    if time.time() - entry[0] > ttl:
+        del _info_cache[url]
+        return None
+    _info_cache.move_to_end(url)
+    return entry
+
+def _put_cached(url, result, format_ids):
+    """Guarda la info de una URL y expulsa las menos usadas si se supera INFO_CACHE_MAX"""
+    _info_cache[url] = (time.time(), result, format_ids)
+    _info_cache.move_to_end(url)
+    while len(_info_cache) > INFO_CACHE_MAX:
+        _info_cache.popitem(last=False)
+
+# Info cruda de yt-dlp para reutilizar en /api/download: url -> (timestamp, info).
+# Solo se lee y escribe desde el event loop.
+MAX_RAW_INFO_CACHE = 32
+_raw_info_cache: Dict[str, tuple] = {}
+
+def store_raw_info(url, info):
+    """Guarda la info cruda de un video, acotando el tamaño del caché"""
+    _raw_info_cache.pop(url, None)
+    while len(_raw_info_cache) >= MAX_RAW_INFO_CACHE:
+        del _raw_info_cache[next(iter(_raw_info_cache))]
+    _raw_info_cache[url] = (time.time(), info)
+
+def pop_raw_info(url, ttl=INFO_CACHE_TTL):
+    """Extrae (y elimina) la info cruda de una URL si sigue vigente"""
+    entry = _raw_info_cache.pop(url, None)
+    if entry and time.time() - entry[0] <= ttl:
+        return entry[1]
+    return None
+
+# Id de formato literal (18, 137, 251-drc...). Lo demás son selectores de yt-dlp
+# (b, bv*+ba, mp4, 137+140/best, best[height<=720]...) y no se validan.
+_PLAIN_FORMAT_ID = re.compile(r'\d[\w-]*')
+
+def is_format_available(url, format_id):
+    """Valida format_id contra la info cacheada (sin volver a extraer)"""
+    if not _PLAIN_FORMAT_ID.fullmatch(format_id):
+        return True
+    cached = _get_cached(url)
+    if not cached:
+        return True
+    return format_id in cached[2]
+
+def format_speed(speed):
+    """Velocidad en bytes/s a texto legible (None si no se conoce)"""
+    if not speed:
+        return None
+    return f"{speed / (1024 * 1024):.1f} MB/s"
+
+def format_eta(eta):
+    """ETA en segundos a texto m:ss (None si no se conoce)"""
+    if not eta:
+        return None
+    return f"{int(eta // 60)}:{int(eta % 60):02d}"
+
+PROGRESS_MIN_INTERVAL = 0.25  # máximo ~4 actualizaciones por segundo
+
+def make_progress_hook(download_id):
+    """Crea un hook de progreso de yt-dlp ligado a una descarga concreta"""
+    last_emit = 0.0
+
+    def progress_hook(d):
+        nonlocal last_emit
+        try:
+            if d['status'] == 'downloading':
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded_bytes = d.get('downloaded_bytes') or 0
+
+                # yt-dlp llama al hook por cada bloque; descartar las actualizaciones
+                # demasiado seguidas salvo la última (solo identificable si se conoce el total)
+                now = time.monotonic()
+                is_last = total_bytes > 0 and downloaded_bytes >= total_bytes
+                if not is_last and now - last_emit < PROGRESS_MIN_INTERVAL:
+                    return
+                last_emit = now
+
+                speed = d.get('speed', 0)
+                eta = d.get('eta', 0)
+
+                if total_bytes > 0:
+                    percentage = (downloaded_bytes / total_bytes) * 100
+                    update_progress(
+                        download_id,
+                        status='downloading',
+                        percentage=round(percentage, 1),
+                        downloaded=downloaded_bytes,
+                        total=total_bytes,
+                        speed=speed,
+                        eta=eta,
+                        speed_formatted=format_speed(speed),
+                        eta_formatted=format_eta(eta)
+                    )
+            elif d['status'] == 'finished':
+                update_progress(download_id, status='processing', file_path=d.get('filename'))
+        except Exception as e:
+            logger.error(f"Error en progress_hook: {e}")
+
+    return progress_hook
+
+def make_postprocessor_hook(download_id):
+    """Crea un hook de postproceso que guarda la ruta final del archivo (p. ej. el .mp3)"""
+    def postprocessor_hook(d):
+        try:
+            if d['status'] != 'finished':
                 return
 
-            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            downloaded_bytes = d.get('downloaded_bytes', 0)
-            speed = d.get('speed', 0)
-            eta = d.get('eta', 0)
-
-            if total_bytes > 0:
-                percentage = (downloaded_bytes / total_bytes) * 100
-                download_progress[download_id].update({
-                    'status': 'downloading',
-                    'percentage': round(percentage, 1),
-                    'downloaded': downloaded_bytes,
-                    'total': total_bytes,
-                    'speed': speed,
-                    'eta': eta
-                })
-        elif d['status'] == 'finished':
-            # Buscar download_id
-            filename = d.get('filename', '')
-            for did in download_progress.keys():
-                if did in filename:
-                    download_progress[did]['status'] = 'processing'
-                    break
-    except Exception as e:
-        logger.error(f"Error en progress_hook: {e}")
+            final_path = d.get('info_dict', {}).get('filepath')
+            if final_path:
+                update_progress(download_id, file_path=final_path)
+        except Exception as e:
+            logger.error(f"Error en postprocessor_hook: {e}")
 
-@app.get("/")
-def read_root():
-    return {
-        "message": "YouTube Downloader API",
-        "version": "1.0.0",
-        "status": "running",
-        "endpoints": {
-            "video_info": "/api/video-info",
-            "download": "/api/download",
-            "progress": "/api/download-progress/{download_id}",
-            "file": "/api/download-file/{download_id}"
-        }
+    return postprocessor_hook
+
+# Máximo de extracciones de info en vuelo (cada una ocupa un hilo del threadpool)
+INFO_CONCURRENCY = 8
+info_semaphore = asyncio.Semaphore(INFO_CONCURRENCY)
+
+# Pool de instancias de YoutubeDL para extraer info, una por extracción simultánea.
+# yt-dlp no es thread-safe, así que cada hilo toma una en exclusiva; se recrean
+# cuando la app cambia las cookies (ver bump_cookies_generation).
+_info_ydl_pool: "queue.Queue[tuple]" = queue.Queue()
+for _ in range(INFO_CONCURRENCY):
+    _info_ydl_pool.put((None, None))  # (instancia, generación de cookies); se crean bajo demanda
+
+def extract_video_info(url, user_agent):
+    """Extrae la información del video con yt-dlp (bloqueante, usar fuera del event loop)"""
+    ydl, ydl_generation = _info_ydl_pool.get()
+    try:
+        generation = _cookies_generation
+        if ydl is None or generation != ydl_generation:
+            if ydl is not None:
+                # Sin guardar su cookie jar: sobrescribiría las cookies nuevas
+                ydl.params['cookiefile'] = None
+                ydl.close()
+            ydl = yt_dlp.YoutubeDL(get_enhanced_ydl_opts())
+            ydl_generation = generation
+
+        ydl.params['http_headers']['User-Agent'] = user_agent
+        return ydl.extract_info(url, download=False)
+    finally:
+        _info_ydl_pool.put((ydl, ydl_generation))
+
+def find_downloaded_file(download_id):
+    """Busca en disco el archivo de una descarga (bloqueante); devuelve (ruta, stat)"""
+    prefix = f"{download_id}_"
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and entry.is_file(follow_symlinks=False):
+                return Path(entry.path), entry.stat(follow_symlinks=False)
+    return None, None
+
+_ROOT_RESPONSE = {
+    "message": "YouTube Downloader API",
+    "version": "1.0.0",
+    "status": "running",
+    "endpoints": {
+        "video_info": "/api/video-info",
+        "download": "/api/download",
+        "progress": "/api/download-progress/{download_id}",
+        "file": "/api/download-file/{download_id}"
     }
+}
+
+@app.get("/")
+async def read_root():
+    return _ROOT_RESPONSE
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy", "timestamp": time.time()}
 
 @app.post("/api/video-info")
@@ -358,15 +753,17 @@ async def get_video_info(request: VideoInfoRequest):
     """Obtiene información detallada del video"""
     try:
         logger.info(f"Obteniendo info para: {request.url}")
-        ensure_cookies_exist()
-        
-        ydl_opts = get_enhanced_ydl_opts()
-        ydl_opts['http_headers']['User-Agent'] = get_random_user_agent()
+        cached = _get_cached(request.url)
+        if cached:
+            logger.info(f"Info en caché para: {request.url}")
+            return cached[1]
+
+        await run_in_threadpool(ensure_cookies_exist)
 
         await asyncio.sleep(random.uniform(0.5, 2.0))
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(request.url, download=False)
+        async with info_semaphore:
+            info = await run_in_threadpool(extract_video_info, request.url, get_random_user_agent())
 
         if not info:
             raise HTTPException(status_code=400, detail="No se pudo obtener información del video")
@@ -374,59 +771,68 @@ async def get_video_info(request: VideoInfoRequest):
         # Procesar formatos de video
         video_formats = []
         audio_formats = []
-        seen_video = set()
-        seen_audio = set()
+        # Claves de deduplicado como tuplas: (altura, ext, fps) y (abr, ext)
+        seen_video: Set[Tuple[int, str, int]] = set()
+        seen_audio: Set[Tuple[int, str]] = set()
 
         for fmt in info.get('formats', []):
+            vcodec = fmt.get('vcodec')
+            acodec = fmt.get('acodec')
+
             # Formatos de video (con audio)
-            if fmt.get('vcodec') != 'none':
-                height = fmt.get('height', 0)
-                if height and height >= 144:  # Filtrar calidades muy bajas
-                    quality = f"{height}p"
-                    ext = fmt.get('ext', 'mp4')
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
-                    fps = fmt.get('fps', 30)
-
-                    format_key = f"{quality}_{ext}_{fps}"
-                    if format_key not in seen_video:
-                        video_formats.append({
-                            'format_id': fmt['format_id'],
-                            'quality': quality,
-                            'ext': ext,
-                            'filesize': filesize,
-                            'fps': fps,
-                            'note': fmt.get('format_note', ''),
-                            'vcodec': fmt.get('vcodec', ''),
-                            'acodec': fmt.get('acodec', ''),
-                            'type': 'video'
-                        })
-                        seen_video.add(format_key)
+            if vcodec != 'none':
+                height = fmt.get('height') or 0
+                if height < 144:  # Filtrar calidades muy bajas
+                    continue
+
+                ext = fmt.get('ext') or 'mp4'
+                fps = fmt.get('fps') or 30
+                format_key = (height, ext, int(fps))
+                if format_key in seen_video:
+                    continue
+
+                video_formats.append({
+                    'format_id': fmt['format_id'],
+                    'quality': f"{height}p",
+                    'height': height,
+                    'ext': ext,
+                    'filesize': fmt.get('filesize') or fmt.get('filesize_approx') or 0,
+                    'fps': fps,
+                    'note': fmt.get('format_note', ''),
+                    'vcodec': vcodec or '',
+                    'acodec': acodec or '',
+                    'type': 'video'
+                })
+                seen_video.add(format_key)
 
             # Formatos de solo audio
-            elif fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none':
-                abr = fmt.get('abr', 0)
-                if abr and abr >= 64:  # Filtrar calidades muy bajas
-                    quality = f"{int(abr)}kbps"
-                    ext = fmt.get('ext', 'mp3')
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
-
-                    format_key = f"{quality}_{ext}"
-                    if format_key not in seen_audio and len(audio_formats) < 5:
-                        audio_formats.append({
-                            'format_id': fmt['format_id'],
-                            'quality': quality,
-                            'ext': ext,
-                            'filesize': filesize,
-                            'abr': abr,
-                            'acodec': fmt.get('acodec', ''),
-                            'type': 'audio'
-                        })
-                        seen_audio.add(format_key)
-
-        # Ordenar formatos
-        video_formats.sort(key=lambda x: x.get('fps', 0), reverse=True)
-        video_formats.sort(key=lambda x: int(x['quality'].replace('p', '')), reverse=True)
-        audio_formats.sort(key=lambda x: x.get('abr', 0), reverse=True)
+            elif acodec != 'none':
+                abr = fmt.get('abr') or 0
+                if abr < 64:  # Filtrar calidades muy bajas
+                    continue
+
+                ext = fmt.get('ext') or 'mp3'
+                abr_int = int(abr)
+                format_key = (abr_int, ext)
+                if format_key in seen_audio:
+                    continue
+
+                audio_formats.append({
+                    'format_id': fmt['format_id'],
+                    'quality': f"{abr_int}kbps",
+                    'ext': ext,
+                    'filesize': fmt.get('filesize') or fmt.get('filesize_approx') or 0,
+                    'abr': abr,
+                    'acodec': acodec or '',
+                    'type': 'audio'
+                })
+                seen_audio.add(format_key)
+
+        # Ordenar formatos (resolución y luego fps, en una sola pasada).
+        # yt-dlp lista los formatos de peor a mejor, así que se recorren todos
+        # y se recorta después de ordenar.
+        video_formats.sort(key=lambda x: (-x['height'], -x['fps']))
+        audio_formats.sort(key=lambda x: -x['abr'])
 
         # Procesar subtítulos
         subtitles = []
@@ -444,6 +850,9 @@ async def get_video_info(request: VideoInfoRequest):
         view_count = info.get('view_count', 0)
         like_count = info.get('like_count', 0)
         upload_date = info.get('upload_date', '')
+        description = info.get('description') or ''
+        if len(description) > 500:
+            description = description[:500] + '...'
 
         result = {
             'title': info.get('title', 'Sin título'),
@@ -453,12 +862,18 @@ async def get_video_info(request: VideoInfoRequest):
             'view_count': view_count,
             'like_count': like_count,
             'upload_date': upload_date,
-            'description': info.get('description', '')[:500] + '...' if info.get('description', '') else '',
+            'description': description,
             'formats': video_formats[:10],  # Limitar a 10 formatos
             'audio_formats': audio_formats[:5],
             'subtitles': subtitles[:10]  # Limitar subtítulos
         }
 
+        format_ids = {fmt.get('format_id') for fmt in info.get('formats', [])}
+        _put_cached(request.url, result, format_ids)
+        if INFO_ALL_FORMATS:
+            # Solo la info completa sirve para resolver cualquier formato al descargar
+            store_raw_info(request.url, info)
+
         logger.info(f"Info obtenida: {len(video_formats)} formatos de video, {len(audio_formats)} de audio")
         return result
 
@@ -470,10 +885,13 @@ async def get_video_info(request: VideoInfoRequest):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.post("/api/download")
-async def download_video(request: DownloadRequest, background_tasks: BackgroundTasks):
+async def download_video(request: DownloadRequest):
     """Inicia la descarga del video"""
+    if not is_format_available(request.url, request.format_id):
+        raise HTTPException(status_code=400, detail=f"Formato no disponible: {request.format_id}")
+
     try:
-        download_id = str(uuid.uuid4())[:8]  # ID más corto
+        download_id = secrets.token_hex(4)  # 8 caracteres hex
         logger.info(f"Iniciando descarga {download_id} para: {request.url}")
 
         # Configurar nombre de archivo
@@ -483,9 +901,21 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
         ydl_opts = {
             'format': request.format_id,
             'outtmpl': str(DOWNLOAD_DIR / filename_template),
-            'progress_hooks': [progress_hook],
+            'progress_hooks': [make_progress_hook(download_id)],
+            'postprocessor_hooks': [make_postprocessor_hook(download_id)],
             'no_warnings': True,
+            # La fecha del archivo es la de descarga y no el Last-Modified del servidor
+            # (suele tener años): si no, la limpieza periódica lo borraría al terminar
+            'updatetime': False,
             'cookiefile': 'cookies/cookies.txt',
+            'cachedir': str(YTDLP_CACHE_DIR),
+            # Escrituras con buffers grandes y descargas por bloques
+            'buffersize': 65536,
+            'http_chunk_size': 10 * 1024 * 1024,
+            'retries': 3,
+            'fragment_retries': 3,
+            # Fragmentos DASH en paralelo (consume más ancho de banda y CPU)
+            'concurrent_fragment_downloads': CONCURRENT_FRAGMENTS,
         }
 
         # Configurar subtítulos
@@ -505,7 +935,7 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
             }]
 
         # Inicializar progreso
-        download_progress[download_id] = {
+        await track_download(download_id, {
             'status': 'starting',
             'percentage': 0,
             'downloaded': 0,
@@ -513,29 +943,31 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
             'speed': 0,
             'eta': 0,
             'created_at': time.time()
-        }
+        })
+
+        # El caché de info cruda solo se toca desde el event loop: se extrae aquí
+        cached_info = pop_raw_info(request.url)
 
         def download_task():
             """Tarea de descarga en background"""
             try:
                 logger.info(f"Ejecutando descarga {download_id}")
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([request.url])
+                    if cached_info:
+                        # Reutilizar la info de /api/video-info y evitar una segunda extracción
+                        ydl.process_ie_result(ydl.sanitize_info(cached_info, remove_private_keys=True), download=True)
+                    else:
+                        ydl.download([request.url])
 
-                download_progress[download_id]['status'] = 'completed'
-                download_progress[download_id]['percentage'] = 100
+                update_progress(download_id, status='completed', percentage=100)
                 logger.info(f"Descarga {download_id} completada")
 
             except Exception as e:
                 logger.error(f"Error en descarga {download_id}: {e}")
-                download_progress[download_id] = {
-                    'status': 'error',
-                    'error': str(e),
-                    'percentage': 0
-                }
+                update_progress(download_id, status='error', error=str(e), percentage=0)
 
-        # Ejecutar descarga en background
-        background_tasks.add_task(download_task)
+        # Ejecutar descarga en el pool dedicado
+        asyncio.get_running_loop().run_in_executor(DOWNLOAD_EXECUTOR, download_task)
 
         return {
             'download_id': download_id,
@@ -550,49 +982,89 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
 @app.get("/api/download-progress/{download_id}")
 async def get_download_progress(download_id: str):
     """Obtiene el progreso de una descarga"""
-    if download_id not in download_progress:
+    # La velocidad y la ETA ya vienen formateadas desde el progress hook
+    progress = await get_progress_snapshot(download_id)
+    if progress is None:
         raise HTTPException(status_code=404, detail="Descarga no encontrada")
 
-    progress = download_progress[download_id].copy()
-
-    # Formatear velocidad y ETA
-    if progress.get('speed'):
-        speed_mb = progress['speed'] / (1024 * 1024)
-        progress['speed_formatted'] = f"{speed_mb:.1f} MB/s"
-
-    if progress.get('eta'):
-        eta_min = progress['eta'] // 60
-        eta_sec = progress['eta'] % 60
-        progress['eta_formatted'] = f"{int(eta_min)}:{int(eta_sec):02d}"
-
     return progress
 
 @app.get("/api/download-file/{download_id}")
-async def download_file(download_id: str):
+async def download_file(
+    download_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+):
     """Descarga el archivo completado"""
-    if download_id not in download_progress:
+    progress = await get_progress_snapshot(download_id)
+    if progress is None:
         raise HTTPException(status_code=404, detail="Descarga no encontrada")
 
-    if download_progress[download_id]['status'] != 'completed':
+    if progress['status'] != 'completed':
         raise HTTPException(status_code=400, detail="Descarga no completada")
 
-    # Buscar archivo descargado
-    for file_path in DOWNLOAD_DIR.glob(f"{download_id}_*"):
-        if file_path.is_file():
-            logger.info(f"Sirviendo archivo: {file_path}")
-            return FileResponse(
-                str(file_path),
-                filename=file_path.name,
-                media_type='application/octet-stream'
-            )
+    # Usar la ruta registrada por los hooks; buscar en disco solo si falta.
+    # El stat se hace una sola vez y se reutiliza para las cabeceras.
+    file_path, st = None, None
+    stored_path = progress.get('file_path')
+    if stored_path:
+        try:
+            st = await aiofiles.os.stat(stored_path)
+            file_path = Path(stored_path)
+        except OSError:
+            pass
+    if file_path is None:
+        file_path, st = await run_in_threadpool(find_downloaded_file, download_id)
+        if not file_path:
+            raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    media_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+    cache_headers = {
+        'ETag': f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+        'Cache-Control': 'private, max-age=3600',
+    }
 
-    raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    logger.info(f"Sirviendo archivo: {file_path}")
+
+    if USE_X_ACCEL:
+        # nginx gestiona también las peticiones con Range
+        return Response(headers={
+            'X-Accel-Redirect': f"{X_ACCEL_PREFIX}{quote(file_path.name)}",
+            'Content-Disposition': f"attachment; filename*=utf-8''{quote(file_path.name)}",
+            'Content-Type': media_type,
+        })
+
+    if range_header:
+        # Reanudación de descargas: servir solo el rango pedido
+        size = st.st_size
+        start, end = parse_byte_range(range_header, size)
+        return StreamingResponse(
+            _file_iter(file_path, start, end - start + 1),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                'Content-Range': f"bytes {start}-{end}/{size}",
+                'Content-Length': str(end - start + 1),
+                'Accept-Ranges': 'bytes',
+                'Content-Disposition': f"attachment; filename*=utf-8''{quote(file_path.name)}",
+                **cache_headers,
+            },
+        )
+
+    # La entrada se conserva para poder reanudar; la limpieza periódica la expira
+    return LargeFileResponse(
+        str(file_path),
+        filename=file_path.name,
+        media_type=media_type,
+        stat_result=st,
+        headers=cache_headers
+    )
 
 @app.delete("/api/cleanup")
 async def cleanup_downloads():
     """Limpia archivos de descarga antiguos"""
     try:
-        cleanup_old_files()
+        # La limpieza pedida explícitamente siempre se ejecuta
+        await run_in_threadpool(cleanup_old_files, True)
         return {"message": "Limpieza completada"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en limpieza: {str(e)}")
@@ -603,4 +1075,19 @@ if __name__ == "__main__":
     print("API: http://localhost:8000")
     print("Docs: http://localhost:8000/docs")
     port = int(os.environ.get("PORT", 8000))  
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
+    # Sin REDIS_URL el progreso de descargas vive en memoria de cada proceso:
+    # con más de un worker las consultas de progreso pueden llegar a otro proceso.
+    workers = int(os.environ.get("WORKERS", 1))
+    if workers > 1 and not REDIS_URL:
+        logger.warning("WORKERS > 1 sin REDIS_URL: el progreso de descargas no se comparte entre procesos")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        reload=False,
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",
+        http="httptools" if importlib.util.find_spec("httptools") else "auto",
+        backlog=2048,
+        timeout_keep_alive=30,  # Mantener la conexión entre consultas de progreso
+    )
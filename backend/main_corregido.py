@@ -4,29 +4,55 @@ YouTube Downloader API
 Servidor FastAPI para descargar videos de YouTube
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
 import yt_dlp
+import anyio
+import anyio.to_thread
 import os
-import uuid
+import secrets
 import asyncio
 import logging
 from typing import Optional, Dict, List
 import json
+import heapq
+import importlib.util
 import time
+import threading
 from pathlib import Path
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app):
+    """Arranque y parada: threadpool, pool de extracción y limpieza periódica"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    get_info_executor()
+    cleanup_task = asyncio.create_task(_cleanup_loop())
+    try:
+        yield
+    finally:
+        cleanup_task.cancel()
+        if _info_executor is not None:
+            discard_info_executor(_info_executor)
+
 app = FastAPI(
     title="YouTube Downloader API",
     description="API para descargar videos de YouTube con opciones avanzadas",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware - Permitir todas las origins para demo
@@ -42,21 +68,14 @@ app.add_middleware(
 DOWNLOAD_DIR = Path("downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
-# Limpiar archivos antiguos al iniciar
-def cleanup_old_files():
-    """Elimina archivos de más de 1 hora"""
-    try:
-        current_time = time.time()
-        for file_path in DOWNLOAD_DIR.glob("*"):
-            if file_path.is_file():
-                file_age = current_time - file_path.stat().st_mtime
-                if file_age > 3600:  # 1 hora
-                    file_path.unlink()
-                    logger.info(f"Archivo eliminado: {file_path}")
-    except Exception as e:
-        logger.error(f"Error limpiando archivos: {e}")
+FILE_CHUNK_SIZE = 1024 * 1024
+
+class LargeFileResponse(FileResponse):
+    """FileResponse con bloques de 1 MiB para archivos de video grandes"""
+    chunk_size = FILE_CHUNK_SIZE
 
-cleanup_old_files()
+# Hilos disponibles para trabajo bloqueante (yt-dlp) en el threadpool de anyio
+THREADPOOL_SIZE = 64
 
 class VideoInfoRequest(BaseModel):
     url: str
@@ -68,26 +87,193 @@ class DownloadRequest(BaseModel):
     subtitle_lang: Optional[str] = None
     audio_only: bool = False
 
-# Almacén de progreso de descargas
-download_progress: Dict[str, Dict] = {}
+@dataclass(slots=True)
+class DownloadProgress:
+    status: str = 'starting'
+    percentage: float = 0
+    downloaded: int = 0
+    total: int = 0
+    speed: float = 0
+    eta: int = 0
+    error: str = ''
+    file_path: str = ''
+    created_at: float = field(default_factory=time.time)
+    last_touched: float = field(default_factory=time.time)
+
+# Almacén de progreso de descargas: LRU acotado con TTL
+MAX_TRACKED_DOWNLOADS = 10000
+PROGRESS_TTL = 7200  # 2 horas
+# Estados de descargas en curso: nunca se expulsan, sus archivos se están escribiendo
+ACTIVE_STATUSES = ('starting', 'downloading', 'processing')
+download_progress: "OrderedDict[str, DownloadProgress]" = OrderedDict()
+# Los hooks de yt-dlp leen desde hilos de descarga y la limpieza corre en el
+# threadpool: toda mutación o recorrido del OrderedDict va bajo este lock
+progress_lock = threading.Lock()
+
+def iter_download_files(download_id):
+    """Entradas de directorio (os.DirEntry) de los archivos de una descarga"""
+    prefix = f"{download_id}_"
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and entry.is_file(follow_symlinks=False):
+                yield entry
+
+def find_download_file(download_id, stored_path=''):
+    """Ruta y stat del archivo de una descarga (bloqueante); usa la ruta registrada si existe"""
+    if stored_path:
+        try:
+            return stored_path, os.stat(stored_path)
+        except OSError:
+            pass
+    for entry in iter_download_files(download_id):
+        return entry.path, entry.stat(follow_symlinks=False)
+    return None, None
+
+def delete_download_files(download_id):
+    """Borra del disco los archivos de una descarga"""
+    for entry in list(iter_download_files(download_id)):
+        try:
+            os.unlink(entry.path)
+            logger.info(f"Archivo eliminado: {entry.path}")
+        except OSError as e:
+            logger.error(f"Error eliminando {entry.path}: {e}")
+
+def track_download(download_id):
+    """Registra una descarga, expulsando las terminadas menos usadas si se supera el límite.
+    Devuelve (progreso, ids expulsados); sus archivos se borran con delete_downloads_files."""
+    evicted = []
+    with progress_lock:
+        for old_id, old in download_progress.items():
+            if len(download_progress) - len(evicted) < MAX_TRACKED_DOWNLOADS:
+                break
+            if old.status not in ACTIVE_STATUSES:
+                evicted.append(old_id)
+        for old_id in evicted:
+            del download_progress[old_id]
+        progress = download_progress[download_id] = DownloadProgress()
+    return progress, evicted
+
+def delete_downloads_files(download_ids):
+    """Borra los archivos de varias descargas (bloqueante, fuera del lock y del event loop)"""
+    for download_id in download_ids:
+        delete_download_files(download_id)
+
+def get_download(download_id):
+    """Devuelve el progreso de una descarga sin alterar el orden LRU (para los hooks)"""
+    with progress_lock:
+        return download_progress.get(download_id)
+
+def touch_download(download_id):
+    """Devuelve el progreso de una descarga marcándolo como usado recientemente"""
+    with progress_lock:
+        progress = download_progress.get(download_id)
+        if progress is not None:
+            progress.last_touched = time.time()
+            download_progress.move_to_end(download_id)
+        return progress
+
+def prune_download_progress():
+    """Expulsa las descargas terminadas cuyo TTL ha expirado"""
+    expired_before = time.time() - PROGRESS_TTL
+    with progress_lock:
+        expired = [
+            download_id for download_id, progress in download_progress.items()
+            if progress.created_at < expired_before and progress.status not in ACTIVE_STATUSES
+        ]
+        for download_id in expired:
+            del download_progress[download_id]
+
+    delete_downloads_files(expired)
+
+def cleanup_old_files():
+    """Elimina archivos de más de 1 hora y olvida descargas expiradas"""
+    current_time = time.time()
+    # os.scandir cachea el stat de cada entrada del directorio
+    with os.scandir(DOWNLOAD_DIR) as entries:
+        for entry in entries:
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                file_age = current_time - entry.stat(follow_symlinks=False).st_mtime
+                if file_age <= 3600:  # 1 hora
+                    continue
+                # Los archivos de una descarga en curso (p. ej. el video ya bajado
+                # mientras llega el audio) se conservan aunque sean antiguos
+                progress = get_download(entry.name[:DOWNLOAD_ID_LEN])
+                if progress is None or progress.status not in ACTIVE_STATUSES:
+                    os.unlink(entry.path)
+                    logger.info(f"Archivo eliminado: {entry.path}")
+            except OSError as e:
+                # Un archivo borrado o bloqueado no debe frenar el resto de la limpieza
+                logger.error(f"Error eliminando {entry.path}: {e}")
+    prune_download_progress()
+
+CLEANUP_INTERVAL = 300  # 5 minutos
+
+async def _cleanup_loop():
+    """Limpia archivos antiguos periódicamente sin bloquear el event loop"""
+    while True:
+        try:
+            await run_in_threadpool(cleanup_old_files)
+        except Exception:
+            logger.exception("Error en la limpieza periódica")
+        await asyncio.sleep(CLEANUP_INTERVAL)
+
+# Cachés LRU con TTL de /api/video-info: url -> (timestamp, valor)
+INFO_CACHE_TTL = 600  # 10 minutos
+INFO_CACHE_MAX = 2048
+RAW_INFO_CACHE_MAX = 32  # La info cruda de yt-dlp ocupa mucho más que la respuesta
+_info_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_raw_info_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# Un lock por URL en extracción: url -> [asyncio.Lock, peticiones que lo usan]
+_info_locks: Dict[str, list] = {}
+
+def _cache_get(cache, url, ttl=INFO_CACHE_TTL):
+    """Devuelve el valor cacheado de una URL si no ha expirado"""
+    entry = cache.get(url)
+    if entry is None:
+        return None
+    if time.time() - entry[0] > ttl:
+        del cache[url]
+        return None
+    cache.move_to_end(url)
+    return entry[1]
+
+def _cache_put(cache, url, value, maxsize):
+    """Guarda un valor y expulsa las entradas menos usadas si se supera maxsize"""
+    cache[url] = (time.time(), value)
+    cache.move_to_end(url)
+    while len(cache) > maxsize:
+        cache.popitem(last=False)
+
+# Descargas simultáneas; el resto espera su turno
+MAX_CONCURRENT_DOWNLOADS = 4
+download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+_download_tasks: set = set()
+_active_downloads = 0
+
+async def run_limited_download(download_task):
+    """Ejecuta una descarga bloqueante respetando el límite de concurrencia"""
+    global _active_downloads
+    async with download_semaphore:
+        _active_downloads += 1
+        try:
+            await run_in_threadpool(download_task)
+        finally:
+            _active_downloads -= 1
+
+DOWNLOAD_ID_LEN = 8
 
 def progress_hook(d):
     """Hook para capturar progreso de yt-dlp"""
     try:
-        if d['status'] == 'downloading':
-            # Extraer ID de descarga del filename
-            filename = d.get('filename', '')
-            download_id = None
-
-            # Buscar el download_id en el filename
-            for did in download_progress.keys():
-                if did in filename:
-                    download_id = did
-                    break
-
-            if not download_id:
-                return
+        # El nombre de archivo empieza siempre por "{download_id}_" (ver outtmpl)
+        download_id = os.path.basename(d.get('filename', ''))[:DOWNLOAD_ID_LEN]
+        progress = get_download(download_id)
+        if progress is None:
+            return
 
+        if d['status'] == 'downloading':
             total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
             downloaded_bytes = d.get('downloaded_bytes', 0)
             speed = d.get('speed', 0)
@@ -95,24 +281,33 @@ def progress_hook(d):
 
             if total_bytes > 0:
                 percentage = (downloaded_bytes / total_bytes) * 100
-                download_progress[download_id].update({
-                    'status': 'downloading',
-                    'percentage': round(percentage, 1),
-                    'downloaded': downloaded_bytes,
-                    'total': total_bytes,
-                    'speed': speed,
-                    'eta': eta
-                })
+                progress.status = 'downloading'
+                progress.percentage = round(percentage, 1)
+                progress.downloaded = downloaded_bytes
+                progress.total = total_bytes
+                progress.speed = speed
+                progress.eta = eta
         elif d['status'] == 'finished':
-            # Buscar download_id
-            filename = d.get('filename', '')
-            for did in download_progress.keys():
-                if did in filename:
-                    download_progress[did]['status'] = 'processing'
-                    break
+            progress.status = 'processing'
+            progress.file_path = d.get('filename', '')
     except Exception as e:
         logger.error(f"Error en progress_hook: {e}")
 
+def postprocessor_hook(d):
+    """Hook de postproceso que guarda la ruta final del archivo (p. ej. el .mp3)"""
+    try:
+        if d['status'] != 'finished':
+            return
+
+        final_path = d.get('info_dict', {}).get('filepath')
+        if not final_path:
+            return
+        progress = get_download(os.path.basename(final_path)[:DOWNLOAD_ID_LEN])
+        if progress is not None:
+            progress.file_path = final_path
+    except Exception as e:
+        logger.error(f"Error en postprocessor_hook: {e}")
+
 @app.get("/")
 def read_root():
     return {
@@ -129,195 +324,291 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "timestamp": time.time()}
-
-@app.post("/api/video-info")
-async def get_video_info(request: VideoInfoRequest):
-    """Obtiene información detallada del video"""
-    try:
-        logger.info(f"Obteniendo info para: {request.url}")
-
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-            'extract_flat': False,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
+    return {
+        "status": "healthy",
+        "timestamp": time.time(),
+        "downloads": {
+            "active": _active_downloads,
+            "queued": len(_download_tasks) - _active_downloads
         }
+    }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(request.url, download=False)
-
-        if not info:
-            raise HTTPException(status_code=400, detail="No se pudo obtener información del video")
-
-        # Procesar TODOS los formatos de video (muxed y video-only)
-        video_formats = []
-        audio_formats = []
-        seen_video = set()
-        seen_audio = set()
-
-        # Primero, agregar formatos especiales para mejores calidades
-        special_formats = [
-            {'format_id': 'best[height<=4320]', 'quality': '4K (Mejor)', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 4K'},
-            {'format_id': 'best[height<=2160]', 'quality': '4K', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 4K'},
-            {'format_id': 'best[height<=1440]', 'quality': '1440p', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 1440p'},
-            {'format_id': 'best[height<=1080]', 'quality': '1080p', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 1080p'},
-            {'format_id': 'best[height<=720]', 'quality': '720p', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 720p'},
-            {'format_id': 'best[height<=480]', 'quality': '480p', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 480p'},
-            {'format_id': 'best[height<=360]', 'quality': '360p', 'ext': 'mp4', 'type': 'best', 'note': 'Mejor calidad disponible en 360p'},
-        ]
+def _special_format(format_id, quality, note):
+    return {
+        'format_id': format_id,
+        'quality': quality,
+        'ext': 'mp4',
+        'filesize': 0,  # No podemos saber el tamaño hasta descargar
+        'fps': 30,
+        'note': note,
+        'vcodec': 'auto',
+        'acodec': 'auto',
+        'type': 'best',
+        'is_special': True
+    }
 
-        # Agregar formatos especiales al inicio
-        for fmt in special_formats:
-            video_formats.append({
-                'format_id': fmt['format_id'],
-                'quality': fmt['quality'],
-                'ext': fmt['ext'],
-                'filesize': 0,  # No podemos saber el tamaño hasta descargar
-                'fps': 30,
-                'note': fmt['note'],
-                'vcodec': 'auto',
-                'acodec': 'auto',
-                'type': fmt['type'],
-                'is_special': True
-            })
+# Formatos especiales para mejores calidades (se construyen una sola vez)
+SPECIAL_FORMATS = (
+    _special_format('best[height<=4320]', '4K (Mejor)', 'Mejor calidad disponible en 4K'),
+    _special_format('best[height<=2160]', '4K', 'Mejor calidad disponible en 4K'),
+    _special_format('best[height<=1440]', '1440p', 'Mejor calidad disponible en 1440p'),
+    _special_format('best[height<=1080]', '1080p', 'Mejor calidad disponible en 1080p'),
+    _special_format('best[height<=720]', '720p', 'Mejor calidad disponible en 720p'),
+    _special_format('best[height<=480]', '480p', 'Mejor calidad disponible en 480p'),
+    _special_format('best[height<=360]', '360p', 'Mejor calidad disponible en 360p'),
+)
 
-        # Luego procesar formatos individuales
-        for fmt in info.get('formats', []):
-            # Formatos de video (tanto muxed como video-only)
-            if fmt.get('vcodec') != 'none':
-                height = fmt.get('height', 0)
-                if height and height >= 144:  # Filtrar calidades muy bajas
-                    quality = f"{height}p"
-                    ext = fmt.get('ext', 'mp4')
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
-                    fps = fmt.get('fps', 30)
-                    has_audio = fmt.get('acodec') != 'none'
-                    
-                    # Crear una clave única para evitar duplicados
-                    format_key = f"{quality}_{ext}_{fps}_{has_audio}"
-                    if format_key not in seen_video:
-                        video_type = 'video+audio' if has_audio else 'video-only'
-                        note = fmt.get('format_note', '')
-                        if not has_audio:
-                            note += ' (requiere audio separado)'
-                        
-                        video_formats.append({
-                            'format_id': fmt['format_id'],
-                            'quality': quality,
-                            'ext': ext,
-                            'filesize': filesize,
-                            'fps': fps,
-                            'note': note,
-                            'vcodec': fmt.get('vcodec', ''),
-                            'acodec': fmt.get('acodec', 'none'),
-                            'type': video_type,
-                            'has_audio': has_audio,
-                            'is_special': False
-                        })
-                        seen_video.add(format_key)
-
-            # Formatos de solo audio
-            elif fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none':
-                abr = fmt.get('abr', 0)
-                if abr and abr >= 64:  # Filtrar calidades muy bajas
-                    quality = f"{int(abr)}kbps"
-                    ext = fmt.get('ext', 'mp3')
-                    filesize = fmt.get('filesize') or fmt.get('filesize_approx', 0)
-
-                    format_key = f"{quality}_{ext}"
-                    if format_key not in seen_audio and len(audio_formats) < 8:
-                        audio_formats.append({
-                            'format_id': fmt['format_id'],
-                            'quality': quality,
-                            'ext': ext,
-                            'filesize': filesize,
-                            'abr': abr,
-                            'acodec': fmt.get('acodec', ''),
-                            'type': 'audio',
-                            'note': fmt.get('format_note', '')
-                        })
-                        seen_audio.add(format_key)
-
-        # Ordenar formatos por calidad (especiales primero, luego por resolución)
-        def sort_video_formats(fmt):
-            if fmt.get('is_special'):
-                # Los formatos especiales van primero, ordenados por calidad
-                quality_order = {'4K (Mejor)': 0, '4K': 1, '1440p': 2, '1080p': 3, '720p': 4, '480p': 5, '360p': 6}
-                return (0, quality_order.get(fmt['quality'], 999))
-            else:
-                # Formatos individuales van después, ordenados por resolución
-                try:
-                    height = int(fmt['quality'].replace('p', ''))
-                    return (1, -height)  # Negativo para orden descendente
-                except:
-                    return (2, 0)
-
-        video_formats.sort(key=sort_video_formats)
-        audio_formats.sort(key=lambda x: x.get('abr', 0), reverse=True)
-
-        # Procesar subtítulos con más detalle
-        subtitles = []
-        if info.get('subtitles'):
-            for lang, subs in info['subtitles'].items():
-                if subs:  # Verificar que hay subtítulos disponibles
-                    # Obtener nombre del idioma más descriptivo
-                    lang_names = {
-                        'en': 'English',
-                        'es': 'Español',
-                        'fr': 'Français',
-                        'de': 'Deutsch',
-                        'it': 'Italiano',
-                        'pt': 'Português',
-                        'ru': 'Русский',
-                        'ja': '日本語',
-                        'ko': '한국어',
-                        'zh': '中文',
-                        'ar': 'العربية'
+QUALITY_ORDER = {'4K (Mejor)': 0, '4K': 1, '1440p': 2, '1080p': 3, '720p': 4, '480p': 5, '360p': 6}
+
+LANG_NAMES = {
+    'en': 'English',
+    'es': 'Español',
+    'fr': 'Français',
+    'de': 'Deutsch',
+    'it': 'Italiano',
+    'pt': 'Português',
+    'ru': 'Русский',
+    'ja': '日本語',
+    'ko': '한국어',
+    'zh': '中文',
+    'ar': 'العربية'
+}
+
+SUBTITLE_PRIORITY = {'en': 0, 'es': 1}
+
+def sort_video_formats(fmt):
+    """Especiales primero (por calidad), luego individuales por resolución descendente"""
+    if fmt['is_special']:
+        return (0, QUALITY_ORDER.get(fmt['quality'], 999))
+    return (1, -fmt['height'])
+
+def sort_subtitles(sub):
+    """Inglés y español primero"""
+    return SUBTITLE_PRIORITY.get(sub['lang'], 999)
+
+def build_video_info_result(info):
+    """Convierte la info cruda de yt-dlp en la respuesta de /api/video-info"""
+    # Procesar TODOS los formatos de video (muxed y video-only)
+    video_formats = []
+    audio_formats = []
+    # Clave de deduplicación -> entrada del formato
+    seen_video = {}
+    seen_audio = {}
+
+    # Primero, agregar formatos especiales para mejores calidades
+    video_formats.extend(SPECIAL_FORMATS)
+
+    # Luego procesar formatos individuales (una sola pasada, vcodec/acodec leídos una vez)
+    for fmt in info.get('formats') or ():
+        get = fmt.get
+        vcodec = get('vcodec')
+        acodec = get('acodec')
+
+        # Formatos de video (tanto muxed como video-only)
+        if vcodec != 'none':
+            height = get('height', 0)
+            if height and height >= 144:  # Filtrar calidades muy bajas
+                ext = get('ext', 'mp4')
+                fps = get('fps', 30)
+                has_audio = acodec != 'none'
+
+                # Clave única (tupla) para evitar duplicados
+                format_key = (height, ext, fps, has_audio)
+                if format_key not in seen_video:
+                    note = get('format_note', '')
+                    if not has_audio:
+                        note += ' (requiere audio separado)'
+
+                    seen_video[format_key] = {
+                        'format_id': fmt['format_id'],
+                        'quality': f"{height}p",
+                        'height': height,
+                        'ext': ext,
+                        'filesize': get('filesize') or get('filesize_approx', 0),
+                        'fps': fps,
+                        'note': note,
+                        'vcodec': vcodec or '',
+                        'acodec': acodec or 'none',
+                        'type': 'video+audio' if has_audio else 'video-only',
+                        'has_audio': has_audio,
+                        'is_special': False
                     }
-                    
-                    display_name = lang_names.get(lang, lang.upper())
-                    
-                    subtitles.append({
-                        'lang': lang,
-                        'name': display_name,
-                        'formats': [sub.get('ext', 'vtt') for sub in subs],
-                        'auto': any(sub.get('name', '').startswith('auto-generated') for sub in subs)
-                    })
-
-        # Ordenar subtítulos (inglés y español primero)
-        def sort_subtitles(sub):
-            priority_langs = {'en': 0, 'es': 1}
-            return priority_langs.get(sub['lang'], 999)
-        
-        subtitles.sort(key=sort_subtitles)
-
-        # Información adicional
-        duration = info.get('duration', 0)
-        view_count = info.get('view_count', 0)
-        like_count = info.get('like_count', 0)
-        upload_date = info.get('upload_date', '')
-
-        result = {
-            'title': info.get('title', 'Sin título'),
-            'duration': duration,
-            'thumbnail': info.get('thumbnail', ''),
-            'uploader': info.get('uploader', 'Desconocido'),
-            'view_count': view_count,
-            'like_count': like_count,
-            'upload_date': upload_date,
-            'description': info.get('description', '')[:500] + '...' if info.get('description', '') else '',
-            'formats': video_formats[:15],  # Más formatos disponibles
-            'audio_formats': audio_formats[:8],
-            'subtitles': subtitles[:15]  # Más subtítulos
-        }
 
-        logger.info(f"Info obtenida: {len(video_formats)} formatos de video, {len(audio_formats)} de audio, {len(subtitles)} subtítulos")
-        return result
+        # Formatos de solo audio (vcodec == 'none' ya implícito)
+        elif acodec != 'none':
+            abr = get('abr', 0)
+            if abr and abr >= 64:  # Filtrar calidades muy bajas
+                ext = get('ext', 'mp3')
+                format_key = (int(abr), ext)
+                # Sin cortar aquí: yt-dlp lista de peor a mejor y nlargest elige los 8 mejores
+                if format_key not in seen_audio:
+                    seen_audio[format_key] = {
+                        'format_id': fmt['format_id'],
+                        'quality': f"{int(abr)}kbps",
+                        'ext': ext,
+                        'filesize': get('filesize') or get('filesize_approx', 0),
+                        'abr': abr,
+                        'acodec': acodec or '',
+                        'type': 'audio',
+                        'note': get('format_note', '')
+                    }
+
+    video_formats.extend(seen_video.values())
+    audio_formats.extend(seen_audio.values())
+
+    # Ordenar formatos por calidad (especiales primero, luego por resolución)
+    # Selección parcial: solo se ordenan los formatos que se devuelven
+    total_video = len(video_formats)
+    video_formats = heapq.nsmallest(15, video_formats, key=sort_video_formats)
+    audio_formats = heapq.nlargest(8, audio_formats, key=lambda x: x.get('abr', 0))
+
+    # Procesar subtítulos con más detalle
+    subtitles = []
+    if info.get('subtitles'):
+        for lang, subs in info['subtitles'].items():
+            if subs:  # Verificar que hay subtítulos disponibles
+                # Obtener nombre del idioma más descriptivo
+                display_name = LANG_NAMES.get(lang, lang.upper())
+                
+                subtitles.append({
+                    'lang': lang,
+                    'name': display_name,
+                    'formats': [sub.get('ext', 'vtt') for sub in subs],
+                    'auto': any(sub.get('name', '').startswith('auto-generated') for sub in subs)
+                })
+
+    # Ordenar subtítulos (inglés y español primero)
+    total_subtitles = len(subtitles)
+    subtitles = heapq.nsmallest(15, subtitles, key=sort_subtitles)
+
+    # Información adicional
+    duration = info.get('duration', 0)
+    view_count = info.get('view_count', 0)
+    like_count = info.get('like_count', 0)
+    upload_date = info.get('upload_date', '')
+    description = info.get('description') or ''
+    if len(description) > 500:
+        description = description[:500] + '...'
+
+    result = {
+        'title': info.get('title', 'Sin título'),
+        'duration': duration,
+        'thumbnail': info.get('thumbnail', ''),
+        'uploader': info.get('uploader', 'Desconocido'),
+        'view_count': view_count,
+        'like_count': like_count,
+        'upload_date': upload_date,
+        'description': description,
+        'formats': video_formats,  # Más formatos disponibles
+        'audio_formats': audio_formats,
+        'subtitles': subtitles  # Más subtítulos
+    }
 
+    logger.info(f"Info obtenida: {total_video} formatos de video, {len(audio_formats)} de audio, {total_subtitles} subtítulos")
+    return result
+
+INFO_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'extract_flat': False,
+    'socket_timeout': 30,
+    'http_headers': {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Connection': 'keep-alive',
+    }
+}
+
+# Extracción de info en procesos aparte: los extractores con mucho trabajo de CPU
+# (firmas JS, listas HLS) retienen el GIL y en hilos se ejecutarían en serie.
+# Cada proceso mantiene su propio YoutubeDL y hay un pool por worker de Uvicorn
+# (WORKERS × INFO_PROCESS_WORKERS procesos en total): por eso el valor por defecto es bajo.
+INFO_PROCESS_WORKERS = int(os.environ.get("INFO_PROCESS_WORKERS", min(2, os.cpu_count() or 1)))
+_info_executor: Optional[ProcessPoolExecutor] = None
+_info_executor_lock = threading.Lock()
+_worker_ydl = None
+
+def _init_info_worker():
+    """Crea la instancia de YoutubeDL que reutiliza cada proceso del pool"""
+    global _worker_ydl
+    _worker_ydl = yt_dlp.YoutubeDL(INFO_YDL_OPTS)
+
+def extract_video_info(url):
+    """Extrae y procesa la info del video en un proceso del pool; devuelve (info, resultado)"""
+    try:
+        info = _worker_ydl.extract_info(url, download=False)
+    except yt_dlp.DownloadError as e:
+        # El original guarda el traceback (exc_info), que no se puede devolver al
+        # proceso principal: se relanza solo con el mensaje
+        raise yt_dlp.DownloadError(str(e)) from None
+    if not info:
+        return None, None
+
+    # Solo tipos serializables para devolverla al proceso principal
+    info = _worker_ydl.sanitize_info(info)
+    return info, build_video_info_result(info)
+
+def get_info_executor():
+    """Devuelve el pool de extracción, creándolo si aún no existe"""
+    global _info_executor
+    with _info_executor_lock:
+        if _info_executor is None:
+            _info_executor = ProcessPoolExecutor(max_workers=INFO_PROCESS_WORKERS, initializer=_init_info_worker)
+        return _info_executor
+
+def discard_info_executor(executor):
+    """Descarta un pool (p. ej. roto) si sigue siendo el actual; el siguiente uso crea otro"""
+    global _info_executor
+    with _info_executor_lock:
+        if _info_executor is not executor:
+            return  # Otra petición ya lo reemplazó
+        _info_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+@app.post("/api/video-info")
+async def get_video_info(request: VideoInfoRequest):
+    """Obtiene información detallada del video"""
+    try:
+        logger.info(f"Obteniendo info para: {request.url}")
+        cached = _cache_get(_info_cache, request.url)
+        if cached:
+            return cached
+
+        # Un solo extract_info por URL aunque lleguen varias peticiones a la vez
+        lock_entry = _info_locks.get(request.url)
+        if lock_entry is None:
+            lock_entry = _info_locks[request.url] = [asyncio.Lock(), 0]
+        lock_entry[1] += 1
+        try:
+            async with lock_entry[0]:
+                cached = _cache_get(_info_cache, request.url)
+                if cached:
+                    return cached
+
+                # Extracción y procesado de formatos fuera del event loop
+                executor = get_info_executor()
+                try:
+                    info, result = await asyncio.get_running_loop().run_in_executor(
+                        executor, extract_video_info, request.url
+                    )
+                except BrokenProcessPool:
+                    # Un proceso murió (p. ej. por memoria): las siguientes usarán un pool nuevo
+                    discard_info_executor(executor)
+                    raise
+                if not info:
+                    raise HTTPException(status_code=400, detail="No se pudo obtener información del video")
+
+                _cache_put(_info_cache, request.url, result, INFO_CACHE_MAX)
+                _cache_put(_raw_info_cache, request.url, info, RAW_INFO_CACHE_MAX)
+                return result
+        finally:
+            # Solo se descarta cuando no queda ninguna petición esperándolo
+            lock_entry[1] -= 1
+            if not lock_entry[1]:
+                del _info_locks[request.url]
+
+    except HTTPException:
+        raise
     except yt_dlp.DownloadError as e:
         logger.error(f"Error de yt-dlp: {e}")
         raise HTTPException(status_code=400, detail=f"Error al procesar el video: {str(e)}")
@@ -326,10 +617,10 @@ async def get_video_info(request: VideoInfoRequest):
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 @app.post("/api/download")
-async def download_video(request: DownloadRequest, background_tasks: BackgroundTasks):
+async def download_video(request: DownloadRequest):
     """Inicia la descarga del video"""
     try:
-        download_id = str(uuid.uuid4())[:8]  # ID más corto
+        download_id = secrets.token_hex(4)  # 8 caracteres hex
         logger.info(f"Iniciando descarga {download_id} para: {request.url}")
 
         # Configurar nombre de archivo
@@ -340,7 +631,11 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
             'format': request.format_id,
             'outtmpl': str(DOWNLOAD_DIR / filename_template),
             'progress_hooks': [progress_hook],
+            'postprocessor_hooks': [postprocessor_hook],
             'no_warnings': True,
+            # La fecha del archivo es la de descarga y no el Last-Modified del servidor
+            # (suele tener años): si no, la limpieza periódica lo borraría al terminar
+            'updatetime': False,
             'http_headers': {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
             }
@@ -372,38 +667,39 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
                 'preferredquality': '192',
             }]
 
-        # Inicializar progreso
-        download_progress[download_id] = {
-            'status': 'starting',
-            'percentage': 0,
-            'downloaded': 0,
-            'total': 0,
-            'speed': 0,
-            'eta': 0,
-            'created_at': time.time()
-        }
+        # Inicializar progreso; los archivos de las descargas expulsadas se borran fuera del event loop
+        progress, evicted = track_download(download_id)
+        if evicted:
+            await run_in_threadpool(delete_downloads_files, evicted)
+
+        # Los cachés solo se tocan desde el event loop: la info se lee aquí
+        cached_info = _cache_get(_raw_info_cache, request.url)
 
         def download_task():
             """Tarea de descarga en background"""
             try:
                 logger.info(f"Ejecutando descarga {download_id}")
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([request.url])
-
-                download_progress[download_id]['status'] = 'completed'
-                download_progress[download_id]['percentage'] = 100
+                    if cached_info:
+                        # Reutilizar la info de /api/video-info y evitar una segunda extracción
+                        ydl.process_ie_result(ydl.sanitize_info(cached_info, remove_private_keys=True), download=True)
+                    else:
+                        ydl.download([request.url])
+
+                progress.status = 'completed'
+                progress.percentage = 100
                 logger.info(f"Descarga {download_id} completada")
 
             except Exception as e:
                 logger.error(f"Error en descarga {download_id}: {e}")
-                download_progress[download_id] = {
-                    'status': 'error',
-                    'error': str(e),
-                    'percentage': 0
-                }
+                progress.status = 'error'
+                progress.error = str(e)
+                progress.percentage = 0
 
-        # Ejecutar descarga en background
-        background_tasks.add_task(download_task)
+        # Ejecutar descarga en background (en cola si ya hay demasiadas en curso)
+        task = asyncio.create_task(run_limited_download(download_task))
+        _download_tasks.add(task)
+        task.add_done_callback(_download_tasks.discard)
 
         return {
             'download_id': download_id,
@@ -418,19 +714,30 @@ async def download_video(request: DownloadRequest, background_tasks: BackgroundT
 @app.get("/api/download-progress/{download_id}")
 async def get_download_progress(download_id: str):
     """Obtiene el progreso de una descarga"""
-    if download_id not in download_progress:
+    p = touch_download(download_id)
+    if p is None:
         raise HTTPException(status_code=404, detail="Descarga no encontrada")
 
-    progress = download_progress[download_id].copy()
+    progress = {
+        'status': p.status,
+        'percentage': p.percentage,
+        'downloaded': p.downloaded,
+        'total': p.total,
+        'speed': p.speed,
+        'eta': p.eta,
+        'created_at': p.created_at
+    }
+    if p.error:
+        progress['error'] = p.error
 
     # Formatear velocidad y ETA
-    if progress.get('speed'):
-        speed_mb = progress['speed'] / (1024 * 1024)
+    if p.speed:
+        speed_mb = p.speed / (1024 * 1024)
         progress['speed_formatted'] = f"{speed_mb:.1f} MB/s"
 
-    if progress.get('eta'):
-        eta_min = progress['eta'] // 60
-        eta_sec = progress['eta'] % 60
+    if p.eta:
+        eta_min = p.eta // 60
+        eta_sec = p.eta % 60
         progress['eta_formatted'] = f"{int(eta_min)}:{int(eta_sec):02d}"
 
     return progress
@@ -438,29 +745,32 @@ async def get_download_progress(download_id: str):
 @app.get("/api/download-file/{download_id}")
 async def download_file(download_id: str):
     """Descarga el archivo completado"""
-    if download_id not in download_progress:
+    progress = touch_download(download_id)
+    if progress is None:
         raise HTTPException(status_code=404, detail="Descarga no encontrada")
 
-    if download_progress[download_id]['status'] != 'completed':
+    if progress.status != 'completed':
         raise HTTPException(status_code=400, detail="Descarga no completada")
 
-    # Buscar archivo descargado
-    for file_path in DOWNLOAD_DIR.glob(f"{download_id}_*"):
-        if file_path.is_file():
-            logger.info(f"Sirviendo archivo: {file_path}")
-            return FileResponse(
-                str(file_path),
-                filename=file_path.name,
-                media_type='application/octet-stream'
-            )
+    # El stat (y la búsqueda en disco, si hace falta) se hace fuera del event loop
+    # y se pasa a FileResponse para que no lo repita
+    file_path, st = await run_in_threadpool(find_download_file, download_id, progress.file_path)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
 
-    raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    logger.info(f"Sirviendo archivo: {file_path}")
+    return LargeFileResponse(
+        file_path,
+        filename=os.path.basename(file_path),
+        media_type='application/octet-stream',
+        stat_result=st
+    )
 
 @app.delete("/api/cleanup")
 async def cleanup_downloads():
     """Limpia archivos de descarga antiguos"""
     try:
-        cleanup_old_files()
+        await run_in_threadpool(cleanup_old_files)
         return {"message": "Limpieza completada"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en limpieza: {str(e)}")
@@ -470,4 +780,18 @@ if __name__ == "__main__":
     print("Iniciando YouTube Downloader API...")
     print("API: http://localhost:8000")
     print("Docs: http://localhost:8000/docs")
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # El progreso de descargas vive en memoria de cada proceso: con más de un
+    # worker las consultas de progreso/archivo deben llegar al proceso que
+    # inició la descarga (sesiones fijas por download_id en el balanceador).
+    workers = int(os.environ.get("WORKERS", 1))
+    if workers > 1:
+        logger.warning("WORKERS > 1: el progreso de descargas no se comparte entre procesos")
+    uvicorn.run(
+        "main_corregido:app",
+        host="127.0.0.1",
+        port=8000,
+        workers=workers,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",
+        http="httptools" if importlib.util.find_spec("httptools") else "auto",
+        backlog=2048,
+    )
@@ -0,0 +1,43 @@
+"""
+Configuración común de los tests del backend
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Los módulos crean downloads/ y cookies/ en el directorio actual al importarse
+os.chdir(tempfile.mkdtemp(prefix="yt-backend-tests-"))
+
+
+def _offline(*args, **kwargs):
+    raise requests.ConnectionError("sin red en los tests")
+
+
+@pytest.fixture(scope="session")
+def main():
+    """main.py importado sin red: las cookies se generan con la plantilla local"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(requests.Session, "get", _offline)
+        import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def main_corregido():
+    import main_corregido
+    return main_corregido
+
+
+def write_download(download_dir, download_id, content=b"0123456789", name="video.mp4"):
+    """Crea en disco el archivo de una descarga y devuelve su ruta"""
+    path = Path(download_dir) / f"{download_id}_{name}"
+    path.write_bytes(content)
+    return path
@@ -0,0 +1,403 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import write_download
+
+
+@pytest.fixture(autouse=True)
+def clean_state(main):
+    main.download_progress.clear()
+    main._info_cache.clear()
+    for path in main.DOWNLOAD_DIR.iterdir():
+        path.unlink()
+    yield
+    main.download_progress.clear()
+    main._info_cache.clear()
+
+
+@pytest.fixture
+def client(main):
+    return TestClient(main.app)
+
+
+def completed_download(main, download_id="abcd1234", content=b"0123456789"):
+    path = write_download(main.DOWNLOAD_DIR, download_id, content)
+    asyncio.run(main.track_download(download_id, {
+        'status': 'completed',
+        'percentage': 100,
+        'created_at': time.time(),
+        'file_path': str(path),
+    }))
+    return download_id
+
+
+# --- Range / reanudación ---
+
+def test_range_requests_can_resume_after_reaching_eof(main, client):
+    download_id = completed_download(main)
+    url = f"/api/download-file/{download_id}"
+
+    r = client.get(url, headers={"Range": "bytes=0-"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == "bytes 0-9/10"
+
+    r = client.get(url, headers={"Range": "bytes=5-"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == "bytes 5-9/10"
+    assert r.content == b"56789"
+
+    r = client.get(url, headers={"Range": "bytes=-3"})
+    assert r.status_code == 206
+    assert r.content == b"789"
+
+
+def test_full_download_keeps_the_entry(main, client):
+    download_id = completed_download(main)
+
+    first = client.get(f"/api/download-file/{download_id}")
+    assert first.status_code == 200
+    assert first.content == b"0123456789"
+    assert first.headers["etag"]
+
+    assert client.get(f"/api/download-file/{download_id}").status_code == 200
+    assert client.get(f"/api/download-progress/{download_id}").status_code == 200
+
+
+def test_range_outside_the_file_is_rejected(main, client):
+    download_id = completed_download(main)
+    r = client.get(f"/api/download-file/{download_id}", headers={"Range": "bytes=20-"})
+    assert r.status_code == 416
+
+
+def test_download_file_falls_back_to_scanning_the_directory(main, client):
+    write_download(main.DOWNLOAD_DIR, "feedbeef")
+    asyncio.run(main.track_download("feedbeef", {'status': 'completed', 'created_at': time.time()}))
+
+    r = client.get("/api/download-file/feedbeef")
+    assert r.status_code == 200
+    assert r.content == b"0123456789"
+
+
+def test_download_file_requires_a_completed_download(main, client):
+    asyncio.run(main.track_download("0badf00d", {'status': 'downloading', 'created_at': time.time()}))
+    assert client.get("/api/download-file/0badf00d").status_code == 400
+    assert client.get("/api/download-file/missing0").status_code == 404
+
+
+def test_parse_byte_range(main):
+    assert main.parse_byte_range("bytes=0-", 10) == (0, 9)
+    assert main.parse_byte_range("bytes=2-4", 10) == (2, 4)
+    assert main.parse_byte_range("bytes=5-100", 10) == (5, 9)
+    assert main.parse_byte_range("bytes=-4", 10) == (6, 9)
+
+
+# --- Caché de información ---
+
+def test_info_cache_evicts_least_recently_used(main, monkeypatch):
+    monkeypatch.setattr(main, "INFO_CACHE_MAX", 2)
+    main._put_cached("a", {"title": "a"}, set())
+    main._put_cached("b", {"title": "b"}, set())
+    assert main._get_cached("a")  # "a" pasa a ser la más reciente
+    main._put_cached("c", {"title": "c"}, set())
+
+    assert list(main._info_cache) == ["a", "c"]
+    assert main._get_cached("b") is None
+
+
+def test_info_cache_expires_entries(main):
+    main._put_cached("a", {"title": "a"}, set())
+    assert main._get_cached("a", ttl=-1) is None
+    assert "a" not in main._info_cache
+
+
+def test_is_format_available_only_validates_plain_ids(main):
+    main._put_cached("url", {}, {"18", "137", "251-drc"})
+
+    assert main.is_format_available("url", "137")
+    assert main.is_format_available("url", "251-drc")
+    assert not main.is_format_available("url", "999")
+    for selector in ("b", "bv", "ba", "mp4", "best", "137+140/best", "bv*+ba", "best[height<=720]"):
+        assert main.is_format_available("url", selector)
+    # Sin info cacheada no se puede validar
+    assert main.is_format_available("other", "999")
+
+
+# --- Almacén de progreso ---
+
+def test_progress_store_updates_and_returns_copies(main):
+    asyncio.run(main.track_download("id1", {'status': 'starting', 'percentage': 0}))
+    assert main.update_progress("id1", status='downloading', percentage=50)
+
+    snapshot = asyncio.run(main.get_progress_snapshot("id1"))
+    assert snapshot == {'status': 'downloading', 'percentage': 50}
+    snapshot['status'] = 'changed'
+    assert main.download_progress["id1"]['status'] == 'downloading'
+
+    assert not main.update_progress("missing", status='completed')
+    assert asyncio.run(main.get_progress_snapshot("missing")) is None
+
+
+def test_progress_store_is_bounded(main, monkeypatch):
+    monkeypatch.setattr(main, "MAX_TRACKED_DOWNLOADS", 2)
+    for download_id in ("id1", "id2", "id3"):
+        asyncio.run(main.track_download(download_id, {'status': 'starting'}))
+    assert list(main.download_progress) == ["id2", "id3"]
+
+
+def test_cleanup_forgets_expired_finished_downloads(main):
+    asyncio.run(main.track_download("old", {'status': 'completed', 'created_at': 0}))
+    asyncio.run(main.track_download("running", {'status': 'downloading', 'created_at': 0}))
+    asyncio.run(main.track_download("recent", {'status': 'completed', 'created_at': time.time()}))
+
+    main.cleanup_old_files(force=True)
+    assert list(main.download_progress) == ["running", "recent"]
+
+
+def test_cleanup_keeps_old_files_of_active_downloads(main):
+    asyncio.run(main.track_download("aaaaaaaa", {'status': 'downloading', 'created_at': time.time()}))
+    asyncio.run(main.track_download("bbbbbbbb", {'status': 'completed', 'created_at': time.time()}))
+    stale = time.time() - 7200
+    video = write_download(main.DOWNLOAD_DIR, "aaaaaaaa", name="video.f137.mp4")
+    finished = write_download(main.DOWNLOAD_DIR, "bbbbbbbb")
+    orphan = write_download(main.DOWNLOAD_DIR, "cccccccc")
+    recent = write_download(main.DOWNLOAD_DIR, "dddddddd")
+    for path in (video, finished, orphan):
+        os.utime(path, (stale, stale))
+
+    main.cleanup_old_files(force=True)
+
+    assert video.exists()
+    assert recent.exists()
+    assert not finished.exists()
+    assert not orphan.exists()
+
+
+def test_downloaded_files_keep_the_local_modification_time(main, client, monkeypatch):
+    opts = []
+
+    class FakeYoutubeDL:
+        def __init__(self, ydl_opts):
+            opts.append(ydl_opts)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def download(self, urls):
+            return 0
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "DOWNLOAD_EXECUTOR", executor)
+    monkeypatch.setattr(main.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+
+    client.post("/api/download", json={'url': 'u', 'format_id': 'best'})
+    executor.shutdown(wait=True)
+
+    assert opts[0]['updatetime'] is False
+
+
+def test_redis_progress_store(main, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(main, "_redis", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(main, "_aredis", fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+
+    async def scenario():
+        await main.track_download("id1", {'status': 'starting', 'percentage': 0, 'eta_formatted': None})
+        main.update_progress("id1", status='downloading', percentage=42.5)
+        return await main.get_progress_snapshot("id1")
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot == {'status': 'downloading', 'percentage': 42.5, 'eta_formatted': None}
+    assert 0 < main._redis.ttl("dl:id1") <= main.REDIS_PROGRESS_TTL
+    assert main.is_download_active("id1")
+    assert not main.is_download_active("missing")
+    assert not main.download_progress
+
+
+# --- Hook de progreso ---
+
+def test_progress_hook_throttles_updates(main, monkeypatch):
+    updates = []
+    monkeypatch.setattr(main, "update_progress", lambda download_id, **fields: updates.append(fields))
+    hook = main.make_progress_hook("id1")
+
+    chunk = {'status': 'downloading', 'total_bytes': 100, 'speed': 1024, 'eta': 5}
+    hook({**chunk, 'downloaded_bytes': 10})
+    hook({**chunk, 'downloaded_bytes': 20})  # demasiado pronto: se descarta
+    hook({**chunk, 'downloaded_bytes': 100})  # la última siempre se aplica
+
+    assert [u['downloaded'] for u in updates] == [10, 100]
+    assert updates[-1]['percentage'] == 100
+    assert updates[0]['speed_formatted'] == "0.0 MB/s"
+    assert updates[0]['eta_formatted'] == "0:05"
+
+
+def test_progress_hook_throttles_when_total_is_unknown(main, monkeypatch):
+    clock = iter([10.0, 10.1, 10.3])
+    updates = []
+    monkeypatch.setattr(main, "update_progress", lambda download_id, **fields: updates.append(fields))
+    monkeypatch.setattr(main.time, "monotonic", lambda: next(clock))
+    hook = main.make_progress_hook("id1")
+
+    hook({'status': 'downloading', 'downloaded_bytes': 10, 'total_bytes': 100})  # t=10.0
+    # Sin total conocido no puede ser la última actualización: se limita como las demás
+    hook({'status': 'downloading', 'downloaded_bytes': 20})  # t=10.1, descartada
+    hook({'status': 'downloading', 'downloaded_bytes': 30, 'total_bytes': 100})  # t=10.3
+
+    assert [u['downloaded'] for u in updates] == [10, 30]
+
+
+def test_download_takes_raw_info_on_the_event_loop(main, client, monkeypatch):
+    processed = []
+
+    class FakeYoutubeDL:
+        def __init__(self, opts):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def sanitize_info(self, info, remove_private_keys=False):
+            return info
+
+        def process_ie_result(self, info, download=True):
+            processed.append(info)
+
+    # Un único hilo de descarga ocupado: la tarea queda en cola
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    executor.submit(release.wait, 5)
+    monkeypatch.setattr(main, "DOWNLOAD_EXECUTOR", executor)
+    monkeypatch.setattr(main.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    main.store_raw_info('u', {'title': 'T'})
+
+    client.post("/api/download", json={'url': 'u', 'format_id': 'best'})
+    # La info sale del caché en el event loop, no en el hilo de descarga
+    assert 'u' not in main._raw_info_cache
+
+    release.set()
+    executor.shutdown(wait=True)
+    assert processed == [{'title': 'T'}]
+
+
+# --- Cookies ---
+
+def test_refresh_cookies_reads_only_the_headers(main, monkeypatch):
+    calls = []
+
+    class FakeResponse:
+        status_code = 200
+        closed = False
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.closed = True
+
+    response = FakeResponse()
+
+    def fake_get(url, **kwargs):
+        calls.append(kwargs)
+        main._yt_session.cookies.set('YSC', 'abc', domain='.youtube.com')
+        return response
+
+    monkeypatch.setattr(main._yt_session, "get", fake_get)
+    generation = main._cookies_generation
+
+    assert main.refresh_cookies()
+    assert calls[0]['stream'] is True
+    assert response.closed
+    assert "\tYSC\tabc" in main.COOKIES_FILE.read_text()
+    assert main._cookies_generation != generation
+
+
+# --- Pool de YoutubeDL para extraer info ---
+
+def test_info_pool_reuses_instances_until_the_app_changes_cookies(main, monkeypatch):
+    created = []
+
+    class FakeYoutubeDL:
+        def __init__(self, opts):
+            self.params = opts
+            self.closed_with = False
+            created.append(self)
+
+        def extract_info(self, url, download=True):
+            # Las descargas reescriben cookies.txt al terminar: no debe invalidar el pool
+            os.utime(main.COOKIES_FILE)
+            return {'title': url}
+
+        def close(self):
+            self.closed_with = self.params['cookiefile']
+
+    monkeypatch.setattr(main.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    main.bump_cookies_generation()
+
+    for _ in range(3 * main.INFO_CONCURRENCY):
+        assert main.extract_video_info('u', 'UA') == {'title': 'u'}
+    assert len(created) == main.INFO_CONCURRENCY
+
+    main.bump_cookies_generation()
+    for _ in range(main.INFO_CONCURRENCY):
+        main.extract_video_info('u', 'UA')
+    assert len(created) == 2 * main.INFO_CONCURRENCY
+    # Las instancias descartadas no guardan su cookie jar sobre las cookies nuevas
+    assert all(ydl.closed_with is None for ydl in created[:main.INFO_CONCURRENCY])
+    assert created[-1].params['http_headers']['User-Agent'] == 'UA'
+
+
+# --- Procesado de formatos ---
+
+def test_get_video_info_processes_formats(main, client, monkeypatch):
+    formats = [
+        {'format_id': '160', 'vcodec': 'avc1', 'acodec': 'none', 'height': 144, 'ext': 'mp4', 'fps': 30},
+        {'format_id': 'low', 'vcodec': 'avc1', 'acodec': 'none', 'height': 90, 'ext': 'mp4', 'fps': 30},
+        {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'ext': 'mp4', 'fps': 30},
+        {'format_id': '136', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'ext': 'mp4', 'fps': 30},
+        {'format_id': '298', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'ext': 'mp4', 'fps': 60},
+        {'format_id': '298b', 'vcodec': 'avc1', 'acodec': 'none', 'height': 720, 'ext': 'mp4', 'fps': 60.0},
+        {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'},
+    ]
+    # yt-dlp lista el audio de peor a mejor: los mejores llegan al final
+    formats += [
+        {'format_id': f'a{abr}', 'vcodec': 'none', 'acodec': 'opus', 'abr': abr, 'ext': 'webm'}
+        for abr in (48, 64, 96, 128, 160, 192, 256)
+    ]
+    info = {'title': 'T', 'description': 'x' * 600, 'formats': formats,
+            'subtitles': {'en': [{'ext': 'vtt'}], 'es': []}}
+    calls = []
+
+    def fake_extract(url, user_agent):
+        calls.append(url)
+        return info
+
+    monkeypatch.setattr(main, "extract_video_info", fake_extract)
+    monkeypatch.setattr(main, "ensure_cookies_exist", lambda: True)
+    monkeypatch.setattr(main.random, "uniform", lambda a, b: 0)
+
+    body = client.post("/api/video-info", json={'url': 'u'}).json()
+
+    assert [f['format_id'] for f in body['formats']] == ['298', '136', '18', '160']
+    assert [f['format_id'] for f in body['audio_formats']] == ['a256', 'a192', 'a160', 'a128', 'a96']
+    assert body['audio_formats'][0]['quality'] == "256kbps"
+    assert body['subtitles'] == [{'lang': 'en', 'name': 'EN', 'formats': ['vtt']}]
+    assert body['description'] == 'x' * 500 + '...'
+
+    # La segunda petición sale del caché y valida ids contra todos los formatos
+    assert client.post("/api/video-info", json={'url': 'u'}).json() == body
+    assert calls == ['u']
+    assert main.is_format_available('u', '298b')
+    assert not main.is_format_available('u', '999')
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import write_download
+
+
+@pytest.fixture(autouse=True)
+def clean_state(main_corregido):
+    m = main_corregido
+    m.download_progress.clear()
+    m._info_cache.clear()
+    m._raw_info_cache.clear()
+    for path in m.DOWNLOAD_DIR.iterdir():
+        path.unlink()
+    yield
+    m.download_progress.clear()
+
+
+@pytest.fixture
+def client(main_corregido):
+    return TestClient(main_corregido.app)
+
+
+def test_lifespan_starts_and_stops_the_extraction_pool(main_corregido):
+    with TestClient(main_corregido.app):
+        assert main_corregido._info_executor is not None
+    assert main_corregido._info_executor is None
+
+
+# --- Almacén de progreso (LRU + TTL) ---
+
+def test_track_download_evicts_finished_downloads_and_their_files(main_corregido, monkeypatch):
+    m = main_corregido
+    monkeypatch.setattr(m, "MAX_TRACKED_DOWNLOADS", 2)
+    m.track_download("aaaaaaaa")[0].status = 'completed'
+    m.track_download("bbbbbbbb")[0].status = 'completed'
+    kept_file = write_download(m.DOWNLOAD_DIR, "aaaaaaaa")
+    evicted_file = write_download(m.DOWNLOAD_DIR, "bbbbbbbb")
+
+    m.touch_download("aaaaaaaa")  # "bbbbbbbb" pasa a ser la menos usada
+    _, evicted = m.track_download("cccccccc")
+
+    assert evicted == ["bbbbbbbb"]
+    assert list(m.download_progress) == ["aaaaaaaa", "cccccccc"]
+    # track_download no toca el disco: el borrado lo hace quien lo llama, fuera del event loop
+    assert evicted_file.exists()
+    m.delete_downloads_files(evicted)
+    assert kept_file.exists()
+    assert not evicted_file.exists()
+
+
+def test_track_download_never_evicts_active_downloads(main_corregido, monkeypatch):
+    m = main_corregido
+    monkeypatch.setattr(m, "MAX_TRACKED_DOWNLOADS", 2)
+    m.track_download("aaaaaaaa")[0].status = 'downloading'
+    m.track_download("bbbbbbbb")[0].status = 'processing'
+    partial = write_download(m.DOWNLOAD_DIR, "aaaaaaaa", name="video.mp4.part")
+
+    _, evicted = m.track_download("cccccccc")
+
+    assert evicted == []
+    assert list(m.download_progress) == ["aaaaaaaa", "bbbbbbbb", "cccccccc"]
+    assert partial.exists()
+
+
+def test_download_deletes_evicted_files_off_the_event_loop(main_corregido, client, monkeypatch):
+    m = main_corregido
+    monkeypatch.setattr(m, "MAX_TRACKED_DOWNLOADS", 1)
+    m.track_download("aaaaaaaa")[0].status = 'completed'
+    calls = []
+
+    def fake_delete(download_ids):
+        try:
+            asyncio.get_running_loop()
+            calls.append((download_ids, 'event loop'))
+        except RuntimeError:
+            calls.append((download_ids, 'thread'))
+
+    async def no_download(download_task):
+        pass
+
+    monkeypatch.setattr(m, "delete_downloads_files", fake_delete)
+    monkeypatch.setattr(m, "run_limited_download", no_download)
+
+    assert client.post("/api/download", json={'url': 'u', 'format_id': 'best'}).status_code == 200
+    assert calls == [(["aaaaaaaa"], 'thread')]
+
+
+def test_prune_only_expires_finished_downloads(main_corregido):
+    m = main_corregido
+    for download_id, status in (("aaaaaaaa", 'completed'), ("bbbbbbbb", 'downloading'), ("cccccccc", 'error')):
+        progress = m.track_download(download_id)[0]
+        progress.status = status
+        progress.created_at = 0
+    m.track_download("dddddddd")[0].status = 'completed'
+    expired_file = write_download(m.DOWNLOAD_DIR, "aaaaaaaa")
+
+    m.prune_download_progress()
+
+    assert list(m.download_progress) == ["bbbbbbbb", "dddddddd"]
+    assert not expired_file.exists()
+
+
+def test_cleanup_keeps_old_files_of_active_downloads(main_corregido):
+    m = main_corregido
+    m.track_download("aaaaaaaa")[0].status = 'downloading'
+    m.track_download("bbbbbbbb")[0].status = 'completed'
+    stale = time.time() - 7200
+    video = write_download(m.DOWNLOAD_DIR, "aaaaaaaa", name="video.f137.mp4")
+    finished = write_download(m.DOWNLOAD_DIR, "bbbbbbbb")
+    orphan = write_download(m.DOWNLOAD_DIR, "cccccccc")
+    recent = write_download(m.DOWNLOAD_DIR, "dddddddd")
+    for path in (video, finished, orphan):
+        os.utime(path, (stale, stale))
+
+    m.cleanup_old_files()
+
+    assert video.exists()
+    assert recent.exists()
+    assert not finished.exists()
+    assert not orphan.exists()
+    assert list(m.download_progress) == ["aaaaaaaa", "bbbbbbbb"]
+
+
+def test_downloaded_files_keep_the_local_modification_time(main_corregido, client, monkeypatch):
+    opts = []
+
+    class FakeYoutubeDL:
+        def __init__(self, ydl_opts):
+            opts.append(ydl_opts)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def download(self, urls):
+            return 0
+
+    monkeypatch.setattr(main_corregido.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+
+    with client:
+        download_id = client.post("/api/download", json={'url': 'u', 'format_id': 'best'}).json()['download_id']
+        for _ in range(100):
+            if main_corregido.download_progress[download_id].status == 'completed':
+                break
+            time.sleep(0.01)
+
+    assert opts[0]['updatetime'] is False
+
+
+def test_progress_hook_updates_without_reordering(main_corregido):
+    m = main_corregido
+    progress = m.track_download("aaaaaaaa")[0]
+    m.track_download("bbbbbbbb")
+    filename = str(m.DOWNLOAD_DIR / "aaaaaaaa_video.mp4")
+
+    m.progress_hook({'status': 'downloading', 'filename': filename,
+                     'total_bytes': 200, 'downloaded_bytes': 50, 'speed': 10, 'eta': 3})
+    assert progress.status == 'downloading'
+    assert progress.percentage == 25.0
+    assert list(m.download_progress) == ["aaaaaaaa", "bbbbbbbb"]
+
+    m.progress_hook({'status': 'finished', 'filename': filename})
+    assert progress.status == 'processing'
+    assert progress.file_path == filename
+
+
+def test_progress_endpoint_formats_speed_and_eta(main_corregido, client):
+    progress = main_corregido.track_download("aaaaaaaa")[0]
+    progress.speed = 2 * 1024 * 1024
+    progress.eta = 75
+
+    body = client.get("/api/download-progress/aaaaaaaa").json()
+    assert body['speed_formatted'] == "2.0 MB/s"
+    assert body['eta_formatted'] == "1:15"
+    assert 'error' not in body
+    assert client.get("/api/download-progress/missing0").status_code == 404
+
+
+# --- Servir archivos ---
+
+def test_download_file_supports_resuming(main_corregido, client):
+    path = write_download(main_corregido.DOWNLOAD_DIR, "aaaaaaaa")
+    progress = main_corregido.track_download("aaaaaaaa")[0]
+    progress.status = 'completed'
+    progress.file_path = str(path)
+
+    r = client.get("/api/download-file/aaaaaaaa", headers={"Range": "bytes=0-"})
+    assert r.status_code == 206
+    r = client.get("/api/download-file/aaaaaaaa", headers={"Range": "bytes=5-"})
+    assert r.status_code == 206
+    assert r.content == b"56789"
+    assert client.get("/api/download-file/aaaaaaaa").status_code == 200
+
+
+def test_download_file_falls_back_to_scanning_the_directory(main_corregido, client):
+    write_download(main_corregido.DOWNLOAD_DIR, "aaaaaaaa")
+    main_corregido.track_download("aaaaaaaa")[0].status = 'completed'
+
+    r = client.get("/api/download-file/aaaaaaaa")
+    assert r.status_code == 200
+    assert r.content == b"0123456789"
+
+
+# --- Caché de video-info ---
+
+def test_info_cache_is_lru_with_ttl(main_corregido):
+    m = main_corregido
+    cache = OrderedDict()
+    m._cache_put(cache, "a", 1, maxsize=2)
+    m._cache_put(cache, "b", 2, maxsize=2)
+    assert m._cache_get(cache, "a") == 1
+    m._cache_put(cache, "c", 3, maxsize=2)
+
+    assert list(cache) == ["a", "c"]
+    assert m._cache_get(cache, "a", ttl=-1) is None
+    assert list(cache) == ["c"]
+
+
+def test_concurrent_video_info_requests_extract_once(main_corregido, monkeypatch):
+    m = main_corregido
+    calls = []
+    release = threading.Event()
+
+    def fake_extract(url):
+        calls.append(url)
+        release.wait(5)
+        info = {'title': 'T', 'formats': []}
+        return info, m.build_video_info_result(info)
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(m, "get_info_executor", lambda: executor)
+    monkeypatch.setattr(m, "extract_video_info", fake_extract)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=m.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [asyncio.create_task(client.post("/api/video-info", json={'url': 'u'})) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.gather(*requests)
+
+    try:
+        responses = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert calls == ['u']
+    assert not m._info_locks
+    assert m._cache_get(m._raw_info_cache, 'u') == {'title': 'T', 'formats': []}
+
+
+def test_video_info_errors_come_back_from_the_process_pool(main_corregido, client):
+    # Pool de procesos real: el error de yt-dlp tiene que poder volver serializado
+    try:
+        r = client.post("/api/video-info", json={'url': 'not-a-url'})
+    finally:
+        main_corregido.discard_info_executor(main_corregido.get_info_executor())
+
+    assert r.status_code == 400
+    assert "not a valid URL" in r.json()['detail']
+    assert not main_corregido._info_locks
+
+
+# --- Procesado de formatos ---
+
+def test_build_video_info_result(main_corregido):
+    info = {
+        'title': 'T',
+        'description': 'x' * 600,
+        'formats': [
+            {'format_id': '18', 'vcodec': 'avc1', 'acodec': 'mp4a', 'height': 360, 'ext': 'mp4', 'fps': 30},
+            {'format_id': '137', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'ext': 'mp4', 'fps': 30},
+            {'format_id': '137b', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'ext': 'mp4', 'fps': 30},
+            {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a', 'abr': 129.5, 'ext': 'm4a'},
+            {'format_id': '251', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160, 'ext': 'webm'},
+            {'format_id': 'sb0', 'vcodec': 'none', 'acodec': 'none', 'ext': 'mhtml'},
+        ],
+        'subtitles': {'fr': [{'ext': 'vtt'}], 'es': [{'ext': 'vtt'}], 'en': [{'ext': 'vtt'}]},
+    }
+    result = main_corregido.build_video_info_result(info)
+
+    special = len(main_corregido.SPECIAL_FORMATS)
+    assert [f['format_id'] for f in result['formats'][special:]] == ['137', '18']
+    assert result['formats'][special]['note'].endswith('(requiere audio separado)')
+    assert [f['format_id'] for f in result['audio_formats']] == ['251', '140']
+    assert [s['lang'] for s in result['subtitles']] == ['en', 'es', 'fr']
+    assert result['description'] == 'x' * 500 + '...'
+
+    info['description'] = 'short'
+    assert main_corregido.build_video_info_result(info)['description'] == 'short'
+
+
+def test_build_video_info_result_keeps_the_best_audio_formats(main_corregido):
+    # yt-dlp lista los formatos de peor a mejor
+    abrs = [64 + 16 * i for i in range(12)]
+    info = {'formats': [
+        {'format_id': f'a{abr}', 'vcodec': 'none', 'acodec': 'opus', 'abr': abr, 'ext': 'webm'}
+        for abr in abrs
+    ]}
+    result = main_corregido.build_video_info_result(info)
+
+    assert [f['abr'] for f in result['audio_formats']] == sorted(abrs, reverse=True)[:8]